@@ -0,0 +1,164 @@
+import re
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r"\d+")
+
+
+class SemanticAnswerCache:
+    """
+    Per-run cache of answered chat questions, matched by question-embedding cosine similarity.
+    Lives in the run directory (deleted with the run); entries are scoped to the chat model
+    and trimmed to `max_entries` by least-recent use. Lookups and hits are counted for hit rates.
+
+    The default `min_similarity` of 0.92 is deliberately strict: it is meant to admit rephrasings
+    of the same question, not questions that share a topic. Template-like questions that differ
+    only in a scope, year or metric number ("Scope 1" / "Scope 2", FY23 / FY24) can still embed
+    above it, so a hit also requires the same numeric tokens in both questions.
+    """
+
+    def __init__(self, db_path: Path, min_similarity: float = 0.92, max_entries: int = 500):
+        self.db_path = Path(db_path)
+        self.min_similarity = min_similarity
+        self.max_entries = max_entries
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " model TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " citations TEXT NOT NULL,"
+                " pages TEXT NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    @staticmethod
+    def _numbers(question: str) -> List[int]:
+        """Numbers in a question (scope, year, metric id...) that must match exactly for a hit."""
+        return sorted(int(n) for n in _NUMBER.findall(question))
+
+    @staticmethod
+    def _count(conn, name: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def lookup(self, question: str, vector: List[float], model: str) -> Optional[Dict[str, Any]]:
+        """
+        Best cached answer to a question with the same numbers and similarity >= `min_similarity`,
+        or None (a miss).
+        """
+        query = self._unit(vector)
+        numbers = self._numbers(question)
+        with self._connect() as conn:
+            rows = [
+                row for row in conn.execute(
+                    "SELECT id, question, vector, answer, citations, pages FROM answers WHERE model = ?", (model,)
+                ).fetchall()
+                if self._numbers(row[1]) == numbers
+            ]
+
+            best, best_score = None, -1.0
+            if rows:
+                matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                scores = matrix @ query
+                idx = int(np.argmax(scores))
+                best, best_score = rows[idx], float(scores[idx])
+
+            self._count(conn, "lookups")
+            if best is None or best_score < self.min_similarity:
+                return None
+
+            self._count(conn, "hits")
+            conn.execute("UPDATE answers SET hits = hits + 1, used_at = ? WHERE id = ?", (time.time(), best[0]))
+
+        logger.info(f"Answer cache hit (similarity {best_score:.3f}) for cached question: {best[1]!r}")
+        return {
+            "question": best[1],
+            "answer": best[3],
+            "citations": json.loads(best[4]),
+            "pages": json.loads(best[5]),
+            "similarity": round(best_score, 4),
+        }
+
+    def store(
+        self,
+        question: str,
+        vector: List[float],
+        model: str,
+        answer: str,
+        citations: List[Dict[str, Any]],
+        pages: List[Any]
+    ):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO answers (model, question, vector, answer, citations, pages, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    model, question, self._unit(vector).tobytes(), answer,
+                    json.dumps(citations, ensure_ascii=False), json.dumps(pages, ensure_ascii=False, default=str),
+                    now, now
+                )
+            )
+            conn.execute(
+                "DELETE FROM answers WHERE id IN ("
+                " SELECT id FROM answers ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups, hits = counters.get("lookups", 0), counters.get("hits", 0)
+        return {
+            "entries": entries,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def load_answer_cache_stats(run_dir: Path, cache_cfg: Optional[Dict]) -> Optional[Dict[str, Any]]:
+    """Hit-rate stats of a run's answer cache (None if disabled or no chat has used it yet)."""
+    if not cache_cfg or not cache_cfg.get("enabled", False):
+        return None
+    path = Path(run_dir) / cache_cfg.get("filename", "chat_answer_cache.sqlite")
+    if not path.exists():
+        return None
+    return SemanticAnswerCache(path).stats()
@@ -0,0 +1,115 @@
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# --- DATA MODEL ---
+
+class ChatSession(BaseModel):
+    """
+    Server-side conversation state: a rolling summary of everything already folded out of
+    the window plus the recent messages kept verbatim.
+    """
+    session_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    run_id: str
+    summary: str = "None."
+    messages: List[Dict[str, str]] = Field(default_factory=list)
+    turns: int = 0
+    summarized_messages: int = 0
+
+    def record_turn(self, question: str, answer: str):
+        self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": answer})
+        self.turns += 1
+
+# --- STORE ---
+
+class ChatSessionStore:
+    """
+    Bounded SQLite session store shared by all API workers: sessions expire `ttl_minutes`
+    after their last turn and at most `max_sessions` are kept (least recently used dropped).
+    """
+
+    def __init__(self, db_path: Path, ttl_minutes: float = 60, max_sessions: int = 1000):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_minutes * 60
+        self.max_sessions = max_sessions
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " run_id TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_lru ON chat_sessions (updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_run ON chat_sessions (run_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, session_id: str, run_id: str) -> Optional[ChatSession]:
+        """Returns the live session, or None if unknown, expired or belonging to another run."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, updated_at FROM chat_sessions WHERE session_id = ? AND run_id = ?",
+                (session_id, run_id)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return ChatSession(**json.loads(row[0]))
+
+    def save(self, session: ChatSession):
+        """Upserts the session and trims expired / excess sessions."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, run_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (session.session_id, session.run_id, session.model_dump_json(), now)
+            )
+            conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id IN ("
+                " SELECT session_id FROM chat_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+
+    def delete_run(self, run_id: str):
+        """Drops every session of a deleted run."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_sessions WHERE run_id = ?", (run_id,))
+
+
+@lru_cache(maxsize=4)
+def _store_instance(db_path: str, ttl_minutes: float, max_sessions: int) -> ChatSessionStore:
+    return ChatSessionStore(Path(db_path), ttl_minutes=ttl_minutes, max_sessions=max_sessions)
+
+
+def get_session_store(sessions_cfg: Optional[Dict]) -> Optional[ChatSessionStore]:
+    """Builds (once per process) the store described by a `sessions` config block, if enabled."""
+    if not sessions_cfg or not sessions_cfg.get("enabled", False):
+        return None
+    return _store_instance(
+        str(sessions_cfg.get("path", "cache/chat_sessions.sqlite")),
+        float(sessions_cfg.get("ttl_minutes", 60)),
+        int(sessions_cfg.get("max_sessions", 1000))
+    )
@@ -1,19 +1,47 @@
+import re
 import sys
+import asyncio
 from pathlib import Path
-from typing import List, Dict, Any
-from litellm import completion
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
 from utils.read_yaml import read_yaml
 from utils.logger import logging
 from utils.exception import CustomException
+from utils.llm_resilience import (
+    RetryPolicy,
+    resilient_completion,
+    aresilient_completion,
+    aresilient_stream,
+    record_fallback
+)
 from retrieval_and_postprocessing.retrieval_full_pipeline import AdvancedRAGRetrievalEngine
+from accompanying_assistant.chat_sessions import ChatSession
+from accompanying_assistant.answer_cache import SemanticAnswerCache
 
 logger = logging.getLogger(__name__)
 
+# Wording that ties a question to earlier turns, so a cached standalone answer would not fit
+_FOLLOW_UP = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|above|previous(ly)?|earlier|same|also|"
+    r"more|else|another|again|elaborate|compare|why|he|she)\b",
+    re.IGNORECASE
+)
+
 class AccompanyingChatbot:
     def __init__(self, config_path: Path, db_path: Path):
         self.config = read_yaml(config_path)
         self.engine = AdvancedRAGRetrievalEngine(config_path=config_path, db_path=db_path)
+        self.llm_policy = RetryPolicy(**self.config.get("resilience", {}))
+
+        # Per-run semantic answer cache, stored next to the vectorstore (None when disabled)
+        cache_cfg = self.config.get("answer_cache", {})
+        self.answer_cache = None
+        if cache_cfg.get("enabled", False):
+            self.answer_cache = SemanticAnswerCache(
+                Path(db_path).parent / cache_cfg.get("filename", "chat_answer_cache.sqlite"),
+                min_similarity=cache_cfg.get("min_similarity", 0.92),
+                max_entries=cache_cfg.get("max_entries", 500)
+            )
 
     def _normalize_history(self, history: List[Any]) -> List[Dict[str, str]]:
         """
@@ -42,66 +70,288 @@ class AccompanyingChatbot:
         return normalized
 
 
+    def _summary_messages(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        history_text = "\n".join([f"{m['role']}: {m['content']}" for m in history])
+        prompt = self.config.prompts.summary_template.format(history=history_text)
+        return [{"role": "user", "content": prompt}]
+
     def _generate_summary(self, history: List[Dict[str, str]]) -> str:
         """Compresses old history to save tokens while retaining context."""
         try:
-            history_text = "\n".join([f"{m['role']}: {m['content']}" for m in history])
-            prompt = self.config.prompts.summary_template.format(history=history_text)
-            
-            response = completion(
+            response = resilient_completion(
                 model=self.config.memory.summary_model,
-                messages=[{"role": "user", "content": prompt}]
+                messages=self._summary_messages(history),
+                policy=self.llm_policy
             )
             return response.choices[0].message.content
         except Exception:
+            record_fallback("chat_summary")
             return "Summary unavailable."
 
-    def get_response(self, question: str, history: List[Dict[str, str]] | None = None):
+    async def _agenerate_summary(self, history: List[Dict[str, str]]) -> str:
+        """Async counterpart of `_generate_summary`."""
         try:
-            if history is None:
-                history = []
-            else:
-                history = self._normalize_history(history)
+            response = await aresilient_completion(
+                model=self.config.memory.summary_model,
+                messages=self._summary_messages(history),
+                policy=self.llm_policy
+            )
+            return response.choices[0].message.content
+        except Exception:
+            record_fallback("chat_summary")
+            return "Summary unavailable."
 
+    async def _afold_summary(self, summary: str, evicted: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Rolling summary update: folds only the newly evicted messages into the existing summary,
+        so the cost per update is bounded by the window size, not the conversation length.
+        Returns None on failure (the caller keeps the messages and retries on a later turn).
+        """
+        history_text = "\n".join([f"{m['role']}: {m['content']}" for m in evicted])
+        prompt = self.config.prompts.rolling_summary_template.format(summary=summary, history=history_text)
+        try:
+            response = await aresilient_completion(
+                model=self.config.memory.summary_model,
+                messages=[{"role": "user", "content": prompt}],
+                policy=self.llm_policy
+            )
+            return response.choices[0].message.content
+        except Exception:
+            record_fallback("chat_summary")
+            return None
+
+    def _split_history(self, history: List[Any] | None) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """(older messages to summarize, recent messages kept verbatim)."""
+        history = self._normalize_history(history) if history else []
+        if len(history) > self.config.memory.summarize_threshold:
+            split_idx = -self.config.memory.max_history_messages
+            return history[:split_idx], history[split_idx:]
+        return [], history
+
+    def _build_messages(
+        self,
+        question: str,
+        summary: str,
+        managed_history: List[Dict[str, str]],
+        context_chunks: List[Any]
+    ) -> List[Dict[str, str]]:
+        if not context_chunks:
+            context_text = "No relevant context found in the report."
+        else:
+            context_text = "\n\n".join(
+                f"[Page {c.metadata.get('page', 'unknown')}]: {c.page_content}"
+                for c in context_chunks
+            )
 
-            summary = "None."
+        system_prompt = self.config.prompts.system_template.format(
+            context=context_text,
+            summary=summary
+        )
 
-            if len(history) > self.config.memory.summarize_threshold:
-                split_idx = -self.config.memory.max_history_messages
-                summary = self._generate_summary(history[:split_idx])
-                managed_history = history[split_idx:]
-            else:
-                managed_history = history
+        return (
+            [{"role": "system", "content": system_prompt}]
+            + managed_history
+            + [{"role": "user", "content": question}]
+        )
+
+    def get_response(self, question: str, history: List[Dict[str, str]] | None = None):
+        try:
+            older, managed_history = self._split_history(history)
+            summary = self._generate_summary(older) if older else "None."
 
             context_chunks, _ = self.engine.get_context_advanced(question)
 
-            if not context_chunks:
-                context_text = "No relevant context found in the report."
-            else:
-                context_text = "\n\n".join(
-                    f"[Page {c.metadata.get('page', 'unknown')}]: {c.page_content}"
-                    for c in context_chunks
-                )
-
-            system_prompt = self.config.prompts.system_template.format(
-                context=context_text,
-                summary=summary
+            response = resilient_completion(
+                model=self.config.model.name,
+                messages=self._build_messages(question, summary, managed_history, context_chunks),
+                policy=self.llm_policy,
+                temperature=self.config.model.temperature
             )
 
-            messages = (
-                [{"role": "system", "content": system_prompt}]
-                + managed_history
-                + [{"role": "user", "content": question}]
+            return response.choices[0].message.content
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _cacheable(self, question: str, history: List[Any] | None, session: Optional[ChatSession]) -> bool:
+        """The answer cache applies when there is no prior conversation or the question stands on its own."""
+        if self.answer_cache is None:
+            return False
+        window = session.messages if session is not None else (history or [])
+        return not window or not _FOLLOW_UP.search(question)
+
+    async def _alookup_answer(
+        self,
+        question: str,
+        history: List[Any] | None,
+        session: Optional[ChatSession]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        """(cached answer or None, question embedding to reuse for retrieval and storing; None when not cacheable)."""
+        if not self._cacheable(question, history, session):
+            return None, None
+        vector = await self.engine.aembed_query(question)
+        hit = await asyncio.to_thread(self.answer_cache.lookup, question, vector, self.config.model.name)
+        return hit, vector
+
+    async def _astore_answer(self, question: str, vector: List[float], answer: str, context_chunks: List[Any]):
+        try:
+            await asyncio.to_thread(
+                self.answer_cache.store,
+                question, vector, self.config.model.name, answer,
+                cited_chunks(answer, context_chunks), _pages(context_chunks)
             )
+        except Exception as e:
+            logger.warning(f"Answer cache store failed: {e}")
+
+    async def _aprepare(
+        self,
+        question: str,
+        history: List[Any] | None,
+        session: Optional[ChatSession] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Dict[str, str]], List[Any]]:
+        """
+        Summary and retrieval run concurrently; returns (LLM messages, context chunks).
+        With a `session` its stored window replaces `history`: once the window passes
+        `memory.summarize_threshold`, the messages beyond `memory.max_history_messages`
+        are folded into the session's rolling summary.
+        """
+        if session is not None:
+            window = session.messages
+            split_idx = len(window) - self.config.memory.max_history_messages
+            evicted = window[:split_idx] if len(window) > self.config.memory.summarize_threshold else []
+
+            async def summarize() -> str:
+                if not evicted:
+                    return session.summary
+                folded = await self._afold_summary(session.summary, evicted)
+                if folded is None:
+                    return session.summary
+                session.summary = folded
+                session.messages = window[split_idx:]
+                session.summarized_messages += len(evicted)
+                return folded
+        else:
+            older, managed_history = self._split_history(history)
+
+            async def summarize() -> str:
+                return await self._agenerate_summary(older) if older else "None."
 
-            response = completion(
+        summary, (context_chunks, _) = await asyncio.gather(
+            summarize(), self.engine.aget_context_advanced(question, query_vector=query_vector)
+        )
+        if session is not None:
+            managed_history = session.messages
+        return self._build_messages(question, summary, managed_history, context_chunks), context_chunks
+
+    async def aget_response(
+        self,
+        question: str,
+        history: List[Dict[str, str]] | None = None,
+        session: Optional[ChatSession] = None
+    ):
+        """
+        Non-blocking `get_response`: the history summary and retrieval run concurrently,
+        LLM and embedding calls use async clients, local search / reranking run off the event loop.
+        With a server-side `session` the turn is appended to it (the caller persists it).
+        Standalone questions close to an earlier one on this run are answered from the answer cache.
+        """
+        try:
+            hit, vector = await self._alookup_answer(question, history, session)
+            if hit is not None:
+                if session is not None:
+                    session.record_turn(question, hit["answer"])
+                return hit["answer"]
+
+            messages, context_chunks = await self._aprepare(question, history, session, query_vector=vector)
+
+            response = await aresilient_completion(
                 model=self.config.model.name,
                 messages=messages,
+                policy=self.llm_policy,
                 temperature=self.config.model.temperature
             )
 
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            if session is not None:
+                session.record_turn(question, answer)
+            if vector is not None:
+                await self._astore_answer(question, vector, answer, context_chunks)
+            return answer
 
         except Exception as e:
             raise CustomException(e, sys)
 
+    async def astream_response(
+        self,
+        question: str,
+        history: List[Dict[str, str]] | None = None,
+        session: Optional[ChatSession] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming `aget_response` as events: 'metadata' (retrieved pages) once retrieval is done,
+        then 'token' deltas from the LLM, then 'done' with the full answer and its citations.
+        An answer-cache hit is sent as a single token (all events flagged `cached`).
+        """
+        try:
+            hit, vector = await self._alookup_answer(question, history, session)
+            if hit is not None:
+                if session is not None:
+                    session.record_turn(question, hit["answer"])
+                yield {"event": "metadata", "data": {"pages": hit["pages"], "num_chunks": None, "cached": True}}
+                yield {"event": "token", "data": {"text": hit["answer"]}}
+                yield {"event": "done", "data": {
+                    "answer": hit["answer"], "citations": hit["citations"],
+                    "cached": True, "similarity": hit["similarity"], "cached_question": hit["question"]
+                }}
+                return
+
+            messages, context_chunks = await self._aprepare(question, history, session, query_vector=vector)
+            yield {"event": "metadata", "data": {
+                "pages": _pages(context_chunks),
+                "num_chunks": len(context_chunks),
+                "cached": False,
+            }}
+
+            parts = []
+            async for text in aresilient_stream(
+                model=self.config.model.name,
+                messages=messages,
+                policy=self.llm_policy,
+                temperature=self.config.model.temperature
+            ):
+                parts.append(text)
+                yield {"event": "token", "data": {"text": text}}
+
+            answer = "".join(parts)
+            if session is not None:
+                session.record_turn(question, answer)
+            if vector is not None:
+                await self._astore_answer(question, vector, answer, context_chunks)
+            yield {"event": "done", "data": {
+                "answer": answer, "citations": cited_chunks(answer, context_chunks), "cached": False
+            }}
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+def _pages(context_chunks: List[Any]) -> List[Any]:
+    return sorted({c.metadata.get("page") for c in context_chunks if c.metadata.get("page") is not None}, key=str)
+
+
+def cited_chunks(answer: str, context_chunks: List[Any]) -> List[Dict[str, Any]]:
+    """Context chunks on the pages the answer cites ('Page 12', 'Pages 12 and 14'), grouped by page."""
+    cited_pages = {
+        page
+        for group in re.findall(r"Pages?\s+((?:\d+(?:\s*(?:,|and|&|-|–)\s*)?)+)", answer)
+        for page in re.findall(r"\d+", group)
+    }
+    citations: Dict[str, Dict[str, Any]] = {}
+    for chunk in context_chunks:
+        page = str(chunk.metadata.get("page"))
+        if page in cited_pages:
+            entry = citations.setdefault(page, {"page": chunk.metadata.get("page"), "chunk_ids": []})
+            if chunk.metadata.get("chunk_id"):
+                entry["chunk_ids"].append(chunk.metadata["chunk_id"])
+    return list(citations.values())
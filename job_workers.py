@@ -0,0 +1,144 @@
+import os
+import time
+import socket
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Any, Dict, List
+
+from utils.logger import logging
+from utils.read_yaml import read_yaml
+from utils.job_store import get_job_store
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_CONFIG = Path("config/job_queue_config.yaml")
+
+# --------------------------------------------------
+# Job Handlers
+# --------------------------------------------------
+
+def handle_ingest(job: Dict[str, Any]):
+    """PDF extraction -> chunking -> embeddings for one uploaded report."""
+    from vectorstore_ingestion.full_ingestion_pipeline import run_ingestion_pipeline
+
+    payload = job["payload"]
+    config_path = Path(payload["config_path"])
+    run_dir = Path(payload["run_dir"])
+    config = read_yaml(config_path)
+    output_paths = {key: run_dir / filename for key, filename in config.output_paths.items()}
+    run_ingestion_pipeline(run_dir / payload["pdf_name"], config_path, output_paths)
+
+
+def handle_report(job: Dict[str, Any]):
+    """Batch retrieval -> LLM QA -> report formatting; a retried job resumes from the run manifest."""
+    from qa_and_report_generation.report_generation_pipeline import ESGReportPipeline
+
+    payload = job["payload"]
+    pipeline = ESGReportPipeline(master_config_path=Path(payload["master_config_path"]), run_dir=Path(payload["run_dir"]))
+    pipeline.run(resume=payload.get("resume", False) or job["attempts"] > 1)
+
+
+JOB_HANDLERS = {
+    "ingest": handle_ingest,
+    "report": handle_report,
+}
+
+# --------------------------------------------------
+# Worker Loop
+# --------------------------------------------------
+
+def _heartbeat_loop(store, job_id: int, interval: float, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            store.heartbeat(job_id)
+        except Exception as e:
+            logger.warning(f"Heartbeat failed for job {job_id}: {e}")
+
+
+def run_job(store, job: Dict[str, Any], heartbeat_seconds: float):
+    """Runs one claimed job, heartbeating while it runs, and records its outcome."""
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat_loop, args=(store, job["job_id"], heartbeat_seconds, stop), daemon=True
+    )
+    beat.start()
+    logger.info(f"Job {job['job_id']} ({job['job_type']}, run {job['run_id']}) started, attempt {job['attempts']}")
+    try:
+        JOB_HANDLERS[job["job_type"]](job)
+        store.finish(job["job_id"])
+        logger.info(f"Job {job['job_id']} completed")
+    except Exception as e:
+        logger.exception(f"Job {job['job_id']} failed")
+        store.finish(job["job_id"], error=str(e) or type(e).__name__)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def worker_loop(job_types: List[str], config_path: str = str(JOB_QUEUE_CONFIG)):
+    """Claims and runs jobs of the given types until the process is stopped."""
+    config = read_yaml(Path(config_path))
+    store = get_job_store(config.get("store"))
+    worker = f"{socket.gethostname()}:{os.getpid()}:{'+'.join(job_types)}"
+    poll = float(config.get("poll_interval_seconds", 1.0))
+    heartbeat = float(config.get("heartbeat_seconds", 15))
+    stale_after = float(config.get("stale_after_seconds", 120))
+    fair_share = bool(config.get("admission", {}).get("fair_share", False))
+
+    logger.info(f"Worker {worker} polling for {job_types}")
+    while True:
+        job = store.claim(job_types, worker, fair_share=fair_share)
+        if job is None:
+            store.requeue_stale(stale_after)
+            time.sleep(poll)
+            continue
+        run_job(store, job, heartbeat)
+
+# --------------------------------------------------
+# Worker Pool
+# --------------------------------------------------
+
+def start_worker_pool(config_path: Path = JOB_QUEUE_CONFIG) -> List[multiprocessing.Process]:
+    """
+    Starts the configured number of worker processes per job type (spawned, so no state is shared).
+    Workers are non-daemonic so report jobs can start their own artifact-build processes;
+    callers must stop them with `stop_worker_pool`.
+    """
+    config = read_yaml(config_path)
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for job_type, count in config.get("workers", {}).items():
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"No handler for job type: {job_type}")
+        for i in range(int(count)):
+            process = ctx.Process(
+                target=worker_loop, args=([job_type], str(config_path)),
+                name=f"{job_type}-worker-{i}", daemon=False
+            )
+            process.start()
+            processes.append(process)
+    logger.info(f"Started {len(processes)} job workers: {dict(config.get('workers', {}))}")
+    return processes
+
+
+def stop_worker_pool(processes: List[multiprocessing.Process], timeout: float = 10):
+    """Terminates the workers (killing any that outlive `timeout`); jobs they were running are re-queued once their heartbeat goes stale."""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"Worker {process.name} did not stop within {timeout}s; killing it.")
+            process.kill()
+            process.join()
+
+
+if __name__ == "__main__":
+    # Standalone worker pool: `python job_workers.py` next to `uvicorn main:app` (embedded_workers: false)
+    pool = start_worker_pool()
+    try:
+        for p in pool:
+            p.join()
+    except KeyboardInterrupt:
+        stop_worker_pool(pool)
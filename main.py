@@ -1,29 +1,64 @@
+import json
 import shutil
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Query
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from fastapi import FastAPI, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from utils.read_yaml import read_yaml
 from utils.logger import logging
 from utils.security_gate import SecurityGate
+from utils.llm_cache import get_llm_cache
+from utils.portfolio_store import GROUP_COLUMNS, get_portfolio_store
+from utils.run_metrics import load_run_metrics
+from utils.job_store import AdmissionController, JobConflictError, QueueFullError, get_job_store
 
 # --- 1. GLOBAL INITIALIZATION ---
 # Initialize the shield once at the top level
 BLACKLIST = ["ignore previous instructions", "system prompt", "developer mode", "print context"]
 SHIELD = SecurityGate(blacklist=BLACKLIST, threshold=0.85)
+# Blocking chat work (SHIELD's torch model, chatbot / Chroma client setup) runs here, off the event loop
+CHAT_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat")
 
 logger = logging.getLogger(__name__)
 
 # Core Pipeline Logic
-from vectorstore_ingestion.full_ingestion_pipeline import run_ingestion_pipeline
 from qa_and_report_generation.report_generation_pipeline import ESGReportPipeline
 from vectorstore_visualization.pca_visualization import BRSRVectorVisualizer
 from accompanying_assistant.chatbot_pipeline import AccompanyingChatbot
+from accompanying_assistant.chat_sessions import ChatSession, get_session_store
+from accompanying_assistant.answer_cache import load_answer_cache_stats
+from qa_and_report_generation.audit_rendering import ensure_audit_markdown
+from job_workers import JOB_QUEUE_CONFIG, start_worker_pool, stop_worker_pool
+
+# Durable job queue and run state shared by every API and worker process
+JOB_CONFIG = read_yaml(JOB_QUEUE_CONFIG)
+JOBS = get_job_store(JOB_CONFIG.get("store"))
+# Bounded queues, per-client caps and Retry-After estimates in front of the job store
+ADMISSION = AdmissionController(JOBS, JOB_CONFIG)
+
+# Server-side chat history (None when sessions are disabled)
+CHAT_CONFIG_PATH = Path("config/accompanying_chatbot_config.yaml")
+CHAT_CONFIG = read_yaml(CHAT_CONFIG_PATH)
+SESSIONS = get_session_store(CHAT_CONFIG.get("sessions"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Single-container deploys run the worker pool next to the API; otherwise start `python job_workers.py`
+    workers = start_worker_pool(JOB_QUEUE_CONFIG) if JOB_CONFIG.get("embedded_workers", False) else []
+    try:
+        yield
+    finally:
+        stop_worker_pool(workers)
+
 
-app = FastAPI(title="ESG Audit API")
+app = FastAPI(title="ESG Audit API", lifespan=lifespan)
 
 # --- 1. CONFIGURATION & STATE ---
 app.add_middleware(
@@ -34,31 +69,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Tracks progress of long-running background tasks
-TASK_STATE: Dict[str, str] = {}
-
 # --- 2. MAINTENANCE ---
 def run_filesystem_cleanup(base_dir: str = "runs", max_age_hours: int = 4):
     """Cleans up processed 'run' folders to manage disk space."""
     base_path = Path(base_dir)
     if not base_path.exists(): return
     now = time.time()
+    completion_cache = get_llm_cache(
+        read_yaml(Path("config/qa_and_report_master_config.yaml")).get("completion_cache")
+    )
     for folder in base_path.iterdir():
         if folder.is_dir() and (now - folder.stat().st_ctime) > (max_age_hours * 3600):
             run_id = folder.name
-            # Only delete if not currently processing
-            if run_id not in TASK_STATE or TASK_STATE[run_id] in ["ready", "completed", "failed"]:
+            # Only delete if no job is queued or running for it
+            if not JOBS.is_active(run_id):
                 shutil.rmtree(folder, ignore_errors=True)
-                TASK_STATE.pop(run_id, None)
+                JOBS.forget_run(run_id)
+                if SESSIONS is not None:
+                    SESSIONS.delete_run(run_id)
+                # Evict the run's replay cache together with its files
+                if completion_cache is not None:
+                    completion_cache.clear_namespace(ESGReportPipeline.cache_namespace(run_id))
+
+def client_id(request: Request) -> str:
+    """Client identity for per-client admission limits: X-Client-Id header, else the caller's IP."""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
+
+def too_busy(run_id: Optional[str], error: QueueFullError) -> JSONResponse:
+    """429 with a Retry-After header when a job is refused admission."""
+    return JSONResponse(
+        status_code=429,
+        content={"run_id": run_id, "error": f"System busy: {error.reason}", "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
 
 # --- 3. AUDIT WORKFLOW ENDPOINTS ---
 
 @app.post("/audit/ingest")
-async def start_document_ingestion(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def start_document_ingestion(request: Request, file: UploadFile = File(...)):
     """
     STAGE 1: Ingestion
     Fully dynamic: Resolves all paths directly from the ConfigBox.
+    Returns 429 with Retry-After (before the upload is stored) when the ingest queue is full.
     """
+    client = client_id(request)
+    try:
+        ADMISSION.check("ingest", client)
+    except QueueFullError as e:
+        return too_busy(None, e)
+
     run_filesystem_cleanup()
     
     # 1. Load Config
@@ -77,30 +136,23 @@ async def start_document_ingestion(background_tasks: BackgroundTasks, file: Uplo
     with pdf_path.open("wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
-    # 4. DYNAMIC PATH RESOLUTION
-    # This loop takes every key in your YAML 'output_paths' and joins it to run_dir
-    # No more hardcoded dictionary!
-    output_paths = {
-        key: run_dir / filename 
-        for key, filename in config.output_paths.items()
-    }
-
-    def execute_ingestion():
-        TASK_STATE[run_name] = "ingesting"
-        try:
-            run_ingestion_pipeline(pdf_path, config_path, output_paths)
-            TASK_STATE[run_name] = "ready"
-        except Exception as e:
-            print(f"Error: {e}")
-            TASK_STATE[run_name] = "failed_ingestion"
-
-    background_tasks.add_task(execute_ingestion)
-    return {"run_id": run_name, "status": "ingesting"}
+    # 4. Queue for an ingest worker (output paths are resolved from 'output_paths' in the worker)
+    try:
+        job_id = ADMISSION.admit(run_name, "ingest", {
+            "run_dir": str(run_dir),
+            "pdf_name": file.filename,
+            "config_path": str(config_path)
+        }, client=client)
+    except QueueFullError as e:
+        # Lost the race for the last slot: drop the upload again
+        shutil.rmtree(run_dir, ignore_errors=True)
+        return too_busy(None, e)
+    return {"run_id": run_name, "status": "queued", "job_id": job_id}
 
 
 
 @app.post("/audit/generate-report/{run_id}")
-async def start_report_generation(run_id: str, background_tasks: BackgroundTasks):
+async def start_report_generation(run_id: str, request: Request):
     """
     STAGE 2 & 3: Retrieval, QA, and Formatting
     Triggers the batch questioning of the document and generates the final ESG report.
@@ -109,20 +161,80 @@ async def start_report_generation(run_id: str, background_tasks: BackgroundTasks
     if not run_dir.exists():
         return {"error": "Run ID not found. Please ingest the document first."}
 
-    def execute_report_pipeline():
-        TASK_STATE[run_id] = "generating_report"
-        try:
-            # ESGReportPipeline handles Batch Retrieval -> LLM QA -> Report Formatting [retrieval config path inside this config]
-            master_config = Path("config/qa_and_report_master_config.yaml")
-            pipeline = ESGReportPipeline(master_config_path=master_config, run_dir=run_dir)
-            pipeline.run()
-            TASK_STATE[run_id] = "completed"
-        except Exception:
-            TASK_STATE[run_id] = "failed_report"
+    return enqueue_report_job(run_id, run_dir, resume=False, client=client_id(request))
 
-    background_tasks.add_task(execute_report_pipeline)
-    return {"run_id": run_id, "status": "generating_report"}
 
+@app.post("/audit/resume/{run_id}")
+async def resume_report_generation(run_id: str, request: Request):
+    """
+    Resumes report generation from the run manifest:
+    finished batches, consolidated records and artifacts with unchanged inputs are reused,
+    only failed or stale units are processed again.
+    """
+    run_dir = Path("runs") / run_id
+    if not run_dir.exists():
+        return {"error": "Run ID not found. Please ingest the document first."}
+    if JOBS.is_active(run_id, "report"):
+        return {"run_id": run_id, "error": "Report generation is already running for this run."}
+
+    response = enqueue_report_job(run_id, run_dir, resume=True, client=client_id(request))
+    return response if isinstance(response, JSONResponse) else {**response, "resume": True}
+
+
+def enqueue_report_job(run_id: str, run_dir: Path, resume: bool, client: str):
+    # ESGReportPipeline handles Batch Retrieval -> LLM QA -> Report Formatting [retrieval config path inside this config]
+    # Only once ingestion has completed, and never alongside another report job of the same run (409)
+    try:
+        job_id = ADMISSION.admit(run_id, "report", {
+            "run_dir": str(run_dir),
+            "master_config_path": "config/qa_and_report_master_config.yaml",
+            "resume": resume
+        }, client=client, after="ingest", exclusive=True)
+    except QueueFullError as e:
+        return too_busy(run_id, e)
+    except JobConflictError as e:
+        return JSONResponse(status_code=409, content={"run_id": run_id, "error": f"Cannot start report: {e.reason}."})
+    return {"run_id": run_id, "status": "report_queued", "job_id": job_id}
+
+
+
+async def open_chat(run_id: str, question: str):
+    """
+    Shared chat setup: vectorstore check, query injection guard and chatbot construction
+    (both blocking, so run on CHAT_EXECUTOR). Returns (bot, None, None) or
+    (None, error payload, HTTP status: 404 no vectorstore / 403 blocked query).
+    """
+    db_path = Path("runs") / run_id / "chroma_db"
+    if not db_path.exists():
+        return None, {"run_id": run_id, "error": "Vectorstore not found."}, 404
+
+    loop = asyncio.get_running_loop()
+
+    # --- Query Injection Guard ---
+    is_evil, reason = await loop.run_in_executor(CHAT_EXECUTOR, SHIELD.is_malicious, question)
+    if is_evil:
+        logger.warning(f"BLOCKED QUERY: {run_id} | Reason: {reason}")
+        return None, {"run_id": run_id, "error": f"Security Violation: {reason}"}, 403
+
+    bot = await loop.run_in_executor(CHAT_EXECUTOR, AccompanyingChatbot, CHAT_CONFIG_PATH, db_path)
+    return bot, None, None
+
+
+async def load_session(run_id: str, payload: Dict) -> Optional[ChatSession]:
+    """
+    Server-side session for this turn: the one named by `session_id` (a new one if it is unknown
+    or expired), a new one when the payload has no `history`, or None for client-managed history.
+    """
+    if SESSIONS is None or ("history" in payload and "session_id" not in payload):
+        return None
+    session = None
+    if payload.get("session_id"):
+        session = await asyncio.to_thread(SESSIONS.get, payload["session_id"], run_id)
+    return session or ChatSession(run_id=run_id)
+
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.post("/audit/chat/{run_id}")
@@ -131,6 +243,11 @@ async def chat_with_report(run_id: str, payload: Dict):
     Chat with an already-ingested ESG report.
 
     Expected payload:
+    {
+        "question": "What are the Scope 3 emissions?",
+        "session_id": "..."          # optional: server-side history, returned by the previous turn
+    }
+    or, with client-managed history:
     {
         "question": "What are the Scope 3 emissions?",
         "history": [
@@ -139,35 +256,26 @@ async def chat_with_report(run_id: str, payload: Dict):
         ]
     }
     """
-
-    run_dir = Path("runs") / run_id
-    db_path = run_dir / "chroma_db"
-
-    if not db_path.exists():
-        return {"run_id": run_id, "error": "Vectorstore not found."}
-
-    # --- Query Injection Guard ---
-    is_evil, reason = SHIELD.is_malicious(payload["question"])
-    if is_evil:
-        logger.warning(f"BLOCKED QUERY: {run_id} | Reason: {reason}")
-        return {
-            "run_id": run_id,
-            "error": f"Security Violation: {reason}"
-        }
-
     try:
-        config_path = Path("config/accompanying_chatbot_config.yaml")
-        bot = AccompanyingChatbot(config_path=config_path, db_path=db_path)
+        bot, error, _ = await open_chat(run_id, payload["question"])
+        if error is not None:
+            return error
 
-        answer = bot.get_response(
+        session = await load_session(run_id, payload)
+        answer = await bot.aget_response(
             question=payload["question"],
-            history=payload.get("history", [])
+            history=payload.get("history", []),
+            session=session
         )
 
-        return {
+        response = {
             "run_id": run_id,
             "answer": answer
         }
+        if session is not None:
+            await asyncio.to_thread(SESSIONS.save, session)
+            response["session_id"] = session.session_id
+        return response
 
     except Exception:
         logger.exception("Chat endpoint failed")
@@ -175,6 +283,48 @@ async def chat_with_report(run_id: str, payload: Dict):
             "run_id": run_id,
             "error": "Chat processing failed"
         }
+
+
+@app.post("/audit/chat/{run_id}/stream")
+async def stream_chat_with_report(run_id: str, payload: Dict):
+    """
+    Streaming variant of `/audit/chat/{run_id}` (same payload) over Server-Sent Events:
+    `metadata` (retrieved pages) as soon as retrieval finishes, `token` events with answer
+    deltas, then `done` with the full answer and its citations (or `error`).
+    Setup errors are plain JSON: 404 without a vectorstore, 403 for a blocked query.
+    """
+    try:
+        bot, error, status_code = await open_chat(run_id, payload["question"])
+        session = await load_session(run_id, payload)
+    except Exception:
+        logger.exception("Chat stream setup failed")
+        bot, error, status_code = None, {"run_id": run_id, "error": "Chat processing failed"}, 500
+    if error is not None:
+        return JSONResponse(status_code=status_code, content=error)
+
+    ids = {"run_id": run_id}
+    if session is not None:
+        ids["session_id"] = session.session_id
+
+    async def events():
+        try:
+            async for item in bot.astream_response(
+                question=payload["question"],
+                history=payload.get("history", []),
+                session=session
+            ):
+                if item["event"] == "done" and session is not None:
+                    await asyncio.to_thread(SESSIONS.save, session)
+                yield sse_event(item["event"], {**ids, **item["data"]})
+        except Exception:
+            logger.exception("Chat stream failed")
+            yield sse_event("error", {"run_id": run_id, "error": "Chat processing failed"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
 @app.get("/audit/download/{run_id}/{file_type}")
@@ -184,21 +334,32 @@ async def download_audit_file(run_id: str, file_type: str):
     - docx: ESG_Audit_Document.docx
     - xlsx: ESG_Disclosures.xlsx
     - md:   batchwise_responses_audit.md
+    - parquet: ESG_Disclosures.parquet (columnar export for bulk analytics)
     """
     file_map = {
         "docx": "ESG_Audit_Document.docx",
         "xlsx": "ESG_Disclosures.xlsx",
-        "md": "batchwise_responses_audit.md"
+        "md": "batchwise_responses_audit.md",
+        "parquet": "ESG_Disclosures.parquet"
     }
 
     if file_type not in file_map:
         return JSONResponse(
             status_code=400, 
-            content={"error": "Invalid file type. Choose docx, xlsx, or md."}
+            content={"error": "Invalid file type. Choose docx, xlsx, md, or parquet."}
         )
 
     file_path = Path("runs") / run_id / file_map[file_type]
 
+    if file_type == "md":
+        # The audit log is rendered from compact chunk references on first request, then cached
+        try:
+            await asyncio.to_thread(
+                ensure_audit_markdown, Path("runs") / run_id, Path("config/qa_and_report_master_config.yaml")
+            )
+        except Exception as e:
+            logger.error(f"Audit log rendering failed for {run_id}: {e}")
+
     if not file_path.exists():
         logger.error(f"Download failed: {file_path} not found.")
         return JSONResponse(
@@ -210,7 +371,8 @@ async def download_audit_file(run_id: str, file_type: str):
     media_types = {
         "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        "md": "text/markdown"
+        "md": "text/markdown",
+        "parquet": "application/vnd.apache.parquet"
     }
 
     return FileResponse(
@@ -269,8 +431,66 @@ async def get_vector_visualization(
 
 @app.get("/audit/status/{run_id}")
 async def fetch_audit_status(run_id: str):
-    """Monitors the progress of the current ingestion or generation task."""
-    return {"run_id": run_id, "status": TASK_STATE.get(run_id, "not_found")}
+    """
+    Monitors the progress of the current ingestion or generation task (read from the shared job store).
+    Status: queued -> ingesting -> ready (or failed_ingestion), then report_queued -> generating_report
+    -> completed (or failed_report); not_found for unknown runs.
+    While a job waits, `queue_position` and `estimated_wait_seconds` report its place in the queue.
+    Includes the run's stage timings, call counts, tokens and cost once a stage has finished,
+    and the hit rate of the run's chat answer cache.
+    """
+    job = await asyncio.to_thread(JOBS.latest_job, run_id)
+    job_info = None
+    if job is not None:
+        job_info = {
+            k: job[k] for k in ("job_id", "job_type", "status", "attempts", "error", "created_at", "started_at", "finished_at")
+        }
+        position = await asyncio.to_thread(JOBS.queue_position, job, ADMISSION.fair_share)
+        if position is not None:
+            job_info["queue_position"] = position
+            job_info["estimated_wait_seconds"] = position * await asyncio.to_thread(ADMISSION.retry_after, job["job_type"])
+    return {
+        "run_id": run_id,
+        "status": await asyncio.to_thread(JOBS.run_status, run_id),
+        "job": job_info,
+        "metrics": load_run_metrics(Path("runs") / run_id),
+        "chat_answer_cache": await asyncio.to_thread(
+            load_answer_cache_stats, Path("runs") / run_id, CHAT_CONFIG.get("answer_cache")
+        )
+    }
+
+
+@app.get("/portfolio/query")
+async def query_portfolio(
+    metric_id: Optional[str] = None,
+    company: Optional[str] = None,
+    year: Optional[int] = None,
+    pillar: Optional[str] = None,
+    disclosed: Optional[bool] = None,
+    group_by: Optional[str] = Query(None, description=f"Aggregate by one of {', '.join(GROUP_COLUMNS)}"),
+    latest_only: bool = Query(True, description="Only the latest run per company and year (runs of unknown company are all kept)"),
+    limit: int = Query(500, ge=1, le=10000),
+):
+    """
+    Cross-run query over consolidated records of every finished report (kept after run cleanup).
+    Without `group_by` returns matching metrics with provenance; with it, disclosure counts and rates.
+    """
+    store = get_portfolio_store(read_yaml(Path("config/qa_and_report_master_config.yaml")).get("portfolio"))
+    if store is None:
+        return JSONResponse(status_code=404, content={"error": "Portfolio store is disabled."})
+    if group_by is not None and group_by not in GROUP_COLUMNS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid group_by. Choose {', '.join(GROUP_COLUMNS)}."}
+        )
+
+    filters = {"metric_id": metric_id, "company": company, "year": year, "pillar": pillar, "disclosed": disclosed}
+    if group_by is None:
+        results = await asyncio.to_thread(store.query, filters, latest_only, limit)
+    else:
+        results = await asyncio.to_thread(store.aggregate, group_by, filters, latest_only)
+
+    return {"filters": {k: v for k, v in filters.items() if v is not None}, "group_by": group_by, "results": results}
 
 
 @app.get("/status")
@@ -0,0 +1,138 @@
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+from chromadb import PersistentClient
+
+from utils.logger import logging
+from utils.exception import CustomException
+from utils.read_yaml import read_yaml
+
+logger = logging.getLogger(__name__)
+
+_RENDER_LOCK = threading.Lock()
+
+# --------------------------------------------------
+# Compact Audit References
+# --------------------------------------------------
+
+def chunk_refs(chunks: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Compact audit references for the chunks sent with a batch prompt: Chroma id, page
+    and retrieval scores, plus the indices of lines trimmed by context packing.
+    Chunks without an id keep their (sent) text inline.
+    """
+    refs = []
+    for chunk in chunks:
+        meta = chunk.metadata
+        ref = {
+            "chunk_id": meta.get("chunk_id"),
+            "page": meta.get("page", "N/A"),
+            "distance": meta.get("distance"),
+            "rerank_score": meta.get("rerank_score"),
+            "questions_served": meta.get("questions_served", 1),
+        }
+        if meta.get("trimmed_lines"):
+            ref["trimmed_lines"] = list(meta["trimmed_lines"])
+        if not ref["chunk_id"]:
+            ref["text"] = chunk.page_content
+        refs.append(ref)
+    return refs
+
+def load_audit_refs(refs_path: Path) -> List[Dict[str, Any]]:
+    """Reads the per-batch audit reference lines in question order."""
+    with open(refs_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# --------------------------------------------------
+# Markdown Rendering
+# --------------------------------------------------
+
+def _fmt_score(value: Any) -> str:
+    return "n/a" if value is None else f"{float(value):.3f}"
+
+def _sent_text(ref: Dict[str, Any], documents: Dict[str, str]) -> str:
+    """The chunk text as sent to the model: stored text, or the vectorstore text minus trimmed lines."""
+    if ref.get("text"):
+        return ref["text"]
+    document = documents.get(ref.get("chunk_id"))
+    if document is None:
+        return "[chunk no longer in vectorstore]"
+    trimmed = set(ref.get("trimmed_lines") or [])
+    return "\n".join(line for i, line in enumerate(document.splitlines()) if i not in trimmed)
+
+def render_audit_markdown(refs_path: Path, db_path: Path, collection_name: str, output_path: Path) -> Path:
+    """
+    Renders the human-readable batch audit log from the compact references, fetching
+    every referenced chunk text from the vectorstore in a single `collection.get` call.
+    Lines trimmed by context packing are removed again, so each chunk shows what the model received.
+    """
+    try:
+        batches = load_audit_refs(refs_path)
+        chunk_ids = list(dict.fromkeys(
+            ref["chunk_id"] for batch in batches for ref in batch["chunks"] if ref.get("chunk_id")
+        ))
+
+        documents: Dict[str, str] = {}
+        if chunk_ids:
+            collection = PersistentClient(path=str(db_path)).get_collection(name=collection_name)
+            fetched = collection.get(ids=chunk_ids, include=["documents"])
+            documents = dict(zip(fetched["ids"], fetched["documents"]))
+
+        lines = ["# ESG Audit Extraction - Process Log\n"]
+        for batch in batches:
+            lines.append(f"\n## Batch: **{batch['batch']}**\n")
+            lines.append(f"> **LLM Extraction Result:**\n>\n")
+            lines.append(f"{batch['raw_answer']}\n")
+
+            if batch.get("abstentions"):
+                lines.append(f"\n### 🚫 Evidence Gate ({len(batch['abstentions'])} questions)\n")
+                for gated in batch["abstentions"]:
+                    lines.append(f"- **{gated['metric_id']}** → {gated['action']}: {gated['reason']}\n")
+
+            lines.append(f"\n### 📚 Retrieved Context Chunks (Total: {len(batch['chunks'])})\n")
+            for i, ref in enumerate(batch["chunks"]):
+                trimmed = len(ref.get("trimmed_lines") or [])
+                lines.append(
+                    f"\n#### Chunk {i+1} (Page {ref.get('page', 'N/A')}) | id={ref.get('chunk_id') or 'n/a'} "
+                    f"| distance={_fmt_score(ref.get('distance'))} | rerank={_fmt_score(ref.get('rerank_score'))} "
+                    f"| served={ref.get('questions_served', 1)}"
+                    + (f" | trimmed={trimmed} overlapping lines (already sent in a neighbouring chunk)" if trimmed else "")
+                    + "\n"
+                )
+                text = _sent_text(ref, documents)
+                lines.append(f"```text\n{text}\n```\n")
+
+            lines.append("\n---\n")
+
+        output_path.write_text("".join(lines), encoding="utf-8")
+        logger.info(f"Rendered audit log for {len(batches)} batches ({len(chunk_ids)} unique chunks) to {output_path}")
+        return output_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def ensure_audit_markdown(run_dir: Path, master_config_path: Path) -> Path:
+    """
+    Returns the run's audit markdown, rendering it from the reference file on first
+    request (or when the references are newer than the cached render).
+    """
+    master_config = read_yaml(master_config_path)
+    retrieval_config = read_yaml(Path(master_config.pipeline.retrieval_config))
+
+    refs_path = run_dir / master_config.filenames.audit_refs_jsonl
+    md_path = run_dir / master_config.filenames.debug_md
+
+    with _RENDER_LOCK:
+        if not refs_path.exists():
+            return md_path
+        if md_path.exists() and md_path.stat().st_mtime >= refs_path.stat().st_mtime:
+            return md_path
+        return render_audit_markdown(
+            refs_path,
+            db_path=run_dir / retrieval_config.vectorstore.db_path_relative,
+            collection_name=retrieval_config.vectorstore.collection_name,
+            output_path=md_path
+        )
@@ -0,0 +1,148 @@
+import re
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+
+from utils.logger import logging
+from utils.exception import CustomException
+from retrieval_and_postprocessing.retrieval_functions import Result
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Token Counting
+# --------------------------------------------------
+
+@lru_cache(maxsize=4)
+def _get_encoding(encoding_name: str):
+    return tiktoken.get_encoding(encoding_name)
+
+def count_tokens(text: str, encoding_name: str = "o200k_base") -> int:
+    """Counts tokens with the tiktoken encoding used by the extraction model family."""
+    return len(_get_encoding(encoding_name).encode(text))
+
+# --------------------------------------------------
+# Chunk Value
+# --------------------------------------------------
+
+def distance_to_similarity(distance: float) -> float:
+    """Chroma L2 distances on unit-norm embeddings map to cosine similarity as 1 - d/2."""
+    return max(0.0, 1.0 - float(distance) / 2.0)
+
+def chunk_value(chunk: Result, coverage_weight: float = 0.5) -> float:
+    """Scores a chunk by retrieval similarity, boosted by how many batch questions retrieved it."""
+    distance = chunk.metadata.get("distance")
+    relevance = 0.5 if distance is None else distance_to_similarity(distance)
+    served = max(1, int(chunk.metadata.get("questions_served", 1)))
+    return relevance * (1.0 + coverage_weight * (served - 1))
+
+# --------------------------------------------------
+# Packing
+# --------------------------------------------------
+
+_NARRATIVE_ID = re.compile(r"^narrative_(\d+)$")
+
+def _body_lines(text: str) -> set:
+    """Whitespace-normalised lines below the [CONTEXT | PAGE ...] header."""
+    return {key for key in (" ".join(line.split()) for line in text.splitlines()[1:]) if key}
+
+def _narrative_window(chunk: Result) -> Optional[Tuple[Optional[int], Any]]:
+    """(window index, page) for narrative chunks; None for tables and anything else."""
+    if chunk.metadata.get("type") != "narrative":
+        return None
+    match = _NARRATIVE_ID.match(str(chunk.metadata.get("chunk_id", "")))
+    return (int(match.group(1)) if match else None), chunk.metadata.get("page")
+
+def _neighbour_lines(window: Tuple[Optional[int], Any], packed_windows: List[Tuple[Optional[int], Any, set]]) -> set:
+    """Lines already sent in packed narrative windows adjacent to, or on the same page as, `window`."""
+    index, page = window
+    seen = set()
+    for other_index, other_page, lines in packed_windows:
+        adjacent = index is not None and other_index is not None and abs(index - other_index) == 1
+        if adjacent or (page is not None and page == other_page):
+            seen |= lines
+    return seen
+
+def _trim_seen_lines(text: str, seen_lines: set) -> Tuple[str, List[int]]:
+    """
+    Drops body lines already sent in a neighbouring narrative window (the overlap carried
+    between consecutive windows). The [CONTEXT | PAGE ...] header is kept.
+    Returns the trimmed text and the indices of the dropped lines in the original text.
+    """
+    lines = text.splitlines()
+    if not lines:
+        return text, []
+
+    kept = [lines[0]]
+    trimmed = []
+    for i, line in enumerate(lines[1:], start=1):
+        key = " ".join(line.split())
+        if key and key in seen_lines:
+            trimmed.append(i)
+            continue
+        kept.append(line)
+
+    return "\n".join(kept), trimmed
+
+def pack_context(
+    chunks: List[Result],
+    max_tokens: int,
+    encoding_name: str = "o200k_base",
+    coverage_weight: float = 0.5
+) -> Tuple[List[Result], Dict[str, Any]]:
+    """
+    Greedily keeps the highest-value chunks under a token budget, trimming the overlap between
+    adjacent / same-page narrative windows.
+    Returns the packed chunks (highest value first, trimmed ones carrying the dropped line
+    indices as `trimmed_lines` metadata) and token/chunk statistics.
+    """
+    try:
+        ranked = sorted(chunks, key=lambda c: chunk_value(c, coverage_weight), reverse=True)
+
+        tokens_before = sum(count_tokens(c.page_content, encoding_name) for c in chunks)
+        packed_windows: List[Tuple[Optional[int], Any, set]] = []
+        packed: List[Result] = []
+        tokens_used = 0
+        lines_trimmed = 0
+
+        for chunk in ranked:
+            # Tables are never trimmed: their header and rows legitimately repeat across tables
+            window = _narrative_window(chunk)
+            if window is None:
+                text, trimmed = chunk.page_content, []
+            else:
+                text, trimmed = _trim_seen_lines(chunk.page_content, _neighbour_lines(window, packed_windows))
+            if not any(line.strip() for line in text.splitlines()[1:]):
+                # Nothing left beyond the context header
+                lines_trimmed += len(trimmed)
+                continue
+
+            tokens = count_tokens(text, encoding_name)
+            if tokens_used + tokens > max_tokens:
+                continue
+
+            tokens_used += tokens
+            lines_trimmed += len(trimmed)
+            if window is not None:
+                packed_windows.append((*window, _body_lines(text)))
+
+            metadata = dict(chunk.metadata)
+            if trimmed:
+                # Lets the audit log show exactly what was sent
+                metadata["trimmed_lines"] = trimmed
+            packed.append(Result(page_content=text, metadata=metadata))
+
+        stats = {
+            "chunks_before": len(chunks),
+            "chunks_after": len(packed),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_used,
+            "tokens_saved": tokens_before - tokens_used,
+            "lines_trimmed": lines_trimmed,
+        }
+        return packed, stats
+
+    except Exception as e:
+        raise CustomException(e, sys)
@@ -0,0 +1,92 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import logging
+from qa_and_report_generation.context_packing import distance_to_similarity
+
+logger = logging.getLogger(__name__)
+
+# Question scaffolding that says nothing about the disclosure being asked for
+_STOPWORDS = {
+    "the", "and", "for", "are", "any", "has", "have", "does", "did", "with", "from", "that", "this",
+    "there", "their", "its", "into", "been", "being", "what", "which", "how", "was", "were", "per",
+    "company", "company's", "companies", "disclose", "disclosed", "disclosure", "report", "reported",
+    "formal", "place", "taken", "such", "other", "total", "entity", "whether", "provide", "details",
+}
+
+# --------------------------------------------------
+# Evidence Signals
+# --------------------------------------------------
+
+def question_keywords(question: str) -> List[str]:
+    """Content keywords of a question (lower-cased, >= 3 chars, scaffolding words removed)."""
+    tokens = re.findall(r"[a-z][a-z0-9\-']+", question.lower())
+    return list(dict.fromkeys(t for t in tokens if len(t) >= 3 and t not in _STOPWORDS))
+
+def keyword_coverage(question: str, texts: List[str]) -> float:
+    """Share of the question's keywords found (as a prefix match, so plurals count) in the texts."""
+    keywords = question_keywords(question)
+    if not keywords:
+        return 1.0
+    haystack = " ".join(texts).lower()
+    hits = sum(1 for k in keywords if re.search(rf"\b{re.escape(k.rstrip('s'))}", haystack))
+    return hits / len(keywords)
+
+def measure_evidence(question: str, chunks: List[Any]) -> Dict[str, Any]:
+    """Best retrieval similarity and keyword coverage of the chunks retrieved for one question."""
+    distances = [c.metadata["distance"] for c in chunks if c.metadata.get("distance") is not None]
+    return {
+        "similarity": round(distance_to_similarity(min(distances)), 3) if distances else None,
+        "coverage": round(keyword_coverage(question, [c.page_content for c in chunks]), 3),
+    }
+
+# --------------------------------------------------
+# Gate
+# --------------------------------------------------
+
+def abstention_reason(evidence: Dict[str, Any], gate: Dict[str, Any]) -> Optional[str]:
+    """
+    Returns why a question is likely undisclosed, or None. Both signals must be weak:
+    a low best-chunk similarity AND low keyword coverage across the retrieved chunks.
+    """
+    similarity = evidence.get("similarity")
+    coverage = evidence.get("coverage", 1.0)
+    min_similarity = gate.get("min_similarity", 0.4)
+    min_coverage = gate.get("min_keyword_coverage", 0.3)
+
+    weak_similarity = similarity is None or similarity < min_similarity
+    if weak_similarity and coverage < min_coverage:
+        shown = "n/a" if similarity is None else f"{similarity:.2f}"
+        return (
+            f"low evidence: best similarity {shown} < {min_similarity}, "
+            f"keyword coverage {coverage:.0%} < {min_coverage:.0%}"
+        )
+    return None
+
+def split_by_evidence(
+    questions: List[Dict],
+    evidence: Dict[str, Dict[str, Any]],
+    gate: Optional[Dict[str, Any]]
+) -> Tuple[List[Dict], List[Dict[str, Any]]]:
+    """
+    Splits a batch into questions for the extraction model and gated ones.
+    Gated entries carry the question, its evidence signals, the reason and the configured action.
+    """
+    if not gate or not gate.get("enabled", False):
+        return questions, []
+
+    kept, gated = [], []
+    for q in questions:
+        signals = evidence.get(q["id"], {})
+        reason = abstention_reason(signals, gate)
+        if reason is None:
+            kept.append(q)
+        else:
+            gated.append({
+                "metric_id": q["id"],
+                "question": q,
+                **signals,
+                "reason": reason,
+                "action": gate.get("action", "drop"),
+            })
+    return kept, gated
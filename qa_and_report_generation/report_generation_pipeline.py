@@ -1,15 +1,28 @@
 import sys
+import json
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 # Module Imports
 from qa_and_report_generation.retrieval_and_qa import run_esg_batch_extraction
-from qa_and_report_generation.responses_postprocessing import run_post_processing_pipeline
-from qa_and_report_generation.report_formatting import run_reporting_pipeline
+from qa_and_report_generation.responses_postprocessing import (
+    StreamingConsolidator,
+    run_post_processing_pipeline,
+    run_structured_post_processing,
+    write_post_processing_outputs
+)
+from qa_and_report_generation.report_formatting import infer_pillar, run_reporting_pipeline
+from qa_and_report_generation.run_manifest import RunManifest
 
 # Utility Imports
 from utils.logger import logging
 from utils.exception import CustomException
 from utils.read_yaml import read_yaml
+from utils.llm_cache import get_llm_cache
+from utils.portfolio_store import get_portfolio_store
+from utils.llm_resilience import RetryPolicy, completion_cache_scope, resilience_stats
+from utils.run_metrics import RunMetrics, metrics_scope, record_metric
 
 logger = logging.getLogger(__name__)
 
@@ -22,41 +35,196 @@ class ESGReportPipeline:
             self.master_config = read_yaml(master_config_path)
             self.run_dir = Path(run_dir)
             self.run_dir.mkdir(parents=True, exist_ok=True)
+            self.llm_policy = RetryPolicy(**self.master_config.get("resilience", {}))
+            # Opt-in response cache for reproducible re-runs (None when disabled)
+            self.completion_cache = get_llm_cache(self.master_config.get("completion_cache"))
+            # Cross-run index of consolidated records (None when disabled)
+            self.portfolio = get_portfolio_store(self.master_config.get("portfolio"))
             
             logger.info(f"Pipeline initialized for directory: {self.run_dir}")
         except Exception as e:
             raise CustomException(e, sys)
 
-    def run(self):
-        """Sequential execution of the ESG extraction and reporting stages."""
+    @staticmethod
+    def cache_namespace(run_id: str) -> str:
+        """Response-cache namespace holding every LLM/embedding call of one run."""
+        return f"completion:{run_id}"
+
+    def run(self, resume: bool = False):
+        """
+        Sequential execution of the ESG extraction and reporting stages.
+        With `resume=True` (and checkpointing enabled) finished batches, parsed records,
+        consolidated records and report artifacts are reused from the run manifest when
+        their inputs are unchanged; otherwise the manifest is reset and the run starts fresh.
+        With `completion_cache` enabled, re-runs on unchanged inputs replay cached responses.
+        Stage timings, LLM/embedding usage and cost go to `run_metrics.json` (also on failure).
+        """
+        manifest = None
+        if self.master_config.get("checkpointing", {}).get("enabled", False):
+            manifest = RunManifest(self.run_dir / self.master_config.filenames.manifest_json, fresh=not resume)
+
+        metrics = RunMetrics(self.run_dir.name)
+        # Cache instances (and their counters) live for the whole worker process: snapshot to report this run only
+        caches = self._caches()
+        cache_baseline = {name: cache.stats() for name, cache in caches.items() if cache is not None}
+        try:
+            with metrics_scope(metrics), \
+                    completion_cache_scope(self.completion_cache, self.cache_namespace(self.run_dir.name)):
+                self._run_stages(metrics, manifest)
+        finally:
+            extras = self._metrics_extras(manifest, caches, cache_baseline)
+            metrics.save(self.run_dir, "report", extra=extras)
+
+        if manifest is not None:
+            logger.info(f"Run manifest summary: {manifest.summary()}")
+        if self.completion_cache is not None:
+            logger.info(f"Completion cache stats: {extras['cache']['completion']}")
+
+    def _caches(self) -> Dict[str, Any]:
+        """The retrieval (rewrite/rerank) and completion caches used by this run (None when disabled)."""
+        retrieval_cfg = read_yaml(Path(self.master_config.pipeline.retrieval_config))
+        return {"retrieval": get_llm_cache(retrieval_cfg.get("cache")), "completion": self.completion_cache}
+
+    def _metrics_extras(
+        self,
+        manifest: Optional[RunManifest],
+        caches: Dict[str, Any],
+        cache_baseline: Dict[str, Dict[str, Dict[str, int]]]
+    ) -> Dict[str, Any]:
+        """Cache (this run's hits/misses), resilience and checkpoint counters stored next to the run metrics."""
+        return {
+            "cache": {
+                name: cache.stats_since(cache_baseline.get(name, {})) if cache is not None else None
+                for name, cache in caches.items()
+            },
+            "resilience": resilience_stats(),
+            "manifest": manifest.summary() if manifest is not None else None,
+        }
+
+    def _run_metadata(self) -> Dict[str, Any]:
+        """Run-level provenance for the columnar export and the portfolio store."""
+        source_pdfs = sorted(p.name for p in self.run_dir.glob("*.pdf"))
+        return {
+            "run_id": self.run_dir.name,
+            "source_document": source_pdfs[0] if source_pdfs else None,
+            "generated_at": datetime.now(timezone.utc),
+            "extraction_model": self.master_config.models.extraction_model,
+        }
+
+    def _ingest_portfolio(self, consolidated_json_path: Path):
+        """Replaces this run's rows in the portfolio store; the report itself is already written, so failures only warn."""
+        try:
+            records = json.loads(consolidated_json_path.read_text(encoding="utf-8"))
+            self.portfolio.ingest_run(self._run_metadata(), records, pillar_of=infer_pillar)
+        except Exception as e:
+            logger.warning(f"Portfolio ingestion failed for {self.run_dir.name}: {e}")
+
+    def _run_stages(self, metrics: RunMetrics, manifest: Optional[RunManifest] = None):
         try:
             # 1. Extraction (retrieval_and_qa.py)
             logger.info(">>> Stage 1: Batch Extraction <<<")
-            run_esg_batch_extraction(
-                config_path=self.master_config.pipeline.retrieval_config,
-                db_path=str(self.run_dir / "chroma_db"),
-                question_path=self.master_config.pipeline.question_path,
-                run_dir=self.run_dir,
-                model=self.master_config.models.extraction_model
-            )
+            with metrics.stage("batch_extraction"):
+                extraction_cfg = self.master_config.get("extraction", {})
+                structured = extraction_cfg.get("mode", "text") == "structured"
+                # Text mode: parse + consolidate each batch answer while extraction continues
+                consolidator = None
+                if not structured and self.master_config.get("consolidation", {}).get("streaming", False):
+                    consolidator = StreamingConsolidator(
+                        model=self.master_config.models.refinement_model,
+                        policy=self.llm_policy,
+                        consolidation=self.master_config.get("consolidation"),
+                        manifest=manifest
+                    )
+                records = run_esg_batch_extraction(
+                    config_path=self.master_config.pipeline.retrieval_config,
+                    db_path=str(self.run_dir / "chroma_db"),
+                    question_path=self.master_config.pipeline.question_path,
+                    run_dir=self.run_dir,
+                    model=self.master_config.models.extraction_model,
+                    audit_refs_filename=self.master_config.filenames.audit_refs_jsonl,
+                    policy=self.llm_policy,
+                    max_concurrency=extraction_cfg.get("max_concurrent_batches", 1),
+                    retrieval_workers=extraction_cfg.get("retrieval_workers", 1),
+                    queue_size=extraction_cfg.get("prefetch_queue_size", 2),
+                    packing=self.master_config.get("context_packing"),
+                    structured=structured,
+                    gate=self.master_config.get("evidence_gate"),
+                    manifest=manifest,
+                    consolidator=consolidator
+                )
 
             # 2. Post-Processing (responses_postprocessing.py)
             logger.info(">>> Stage 2: Post-Processing & Consolidation <<<")
-            run_post_processing_pipeline(
-                input_file=self.run_dir / self.master_config.filenames.raw_responses_txt,
-                intermediate_file=self.run_dir / self.master_config.filenames.intermediate_json,
-                output_file=self.run_dir / self.master_config.filenames.consolidated_json,
-                model=self.master_config.models.refinement_model
-            )
+            with metrics.stage("post_processing"):
+                if structured:
+                    run_structured_post_processing(
+                        records=records,
+                        intermediate_file=self.run_dir / self.master_config.filenames.intermediate_json,
+                        output_file=self.run_dir / self.master_config.filenames.consolidated_json
+                    )
+                elif consolidator is not None:
+                    write_post_processing_outputs(
+                        extracted_records=consolidator.extracted_records,
+                        final_data=consolidator.consolidated_records,
+                        intermediate_file=self.run_dir / self.master_config.filenames.intermediate_json,
+                        output_file=self.run_dir / self.master_config.filenames.consolidated_json
+                    )
+                else:
+                    run_post_processing_pipeline(
+                        input_file=self.run_dir / self.master_config.filenames.raw_responses_txt,
+                        intermediate_file=self.run_dir / self.master_config.filenames.intermediate_json,
+                        output_file=self.run_dir / self.master_config.filenames.consolidated_json,
+                        model=self.master_config.models.refinement_model,
+                        policy=self.llm_policy,
+                        consolidation=self.master_config.get("consolidation"),
+                        manifest=manifest
+                    )
 
             # 3. Formatting (report_formatting.py)
             logger.info(">>> Stage 3: Report Formatting <<<")
-            run_reporting_pipeline(
-                consolidated_json_path=self.run_dir / self.master_config.filenames.consolidated_json,
-                questions_jsonl_path=Path(self.master_config.pipeline.question_path),
-                output_docx_path=self.run_dir / self.master_config.filenames.final_docx,
-                output_xlsx_path=self.run_dir / self.master_config.filenames.final_xlsx
-            )
+            with metrics.stage("formatting"):
+                consolidated_json_path = self.run_dir / self.master_config.filenames.consolidated_json
+                questions_jsonl_path = Path(self.master_config.pipeline.question_path)
+                output_docx_path = self.run_dir / self.master_config.filenames.final_docx
+                output_xlsx_path = self.run_dir / self.master_config.filenames.final_xlsx
+                output_parquet_path = self.run_dir / self.master_config.filenames.final_parquet
+
+                formatting_hash = RunManifest.input_hash(
+                    consolidated_json_path.read_text(encoding="utf-8"),
+                    questions_jsonl_path.read_text(encoding="utf-8")
+                )
+                if (
+                    manifest is not None
+                    and manifest.get("stages", "formatting", formatting_hash) is not None
+                    and output_docx_path.exists() and output_xlsx_path.exists()
+                    and output_parquet_path.exists()
+                ):
+                    logger.info("Report artifacts are up to date; skipping formatting.")
+                else:
+                    reporting_cfg = self.master_config.get("reporting", {})
+                    artifact_seconds = run_reporting_pipeline(
+                        consolidated_json_path=consolidated_json_path,
+                        questions_jsonl_path=questions_jsonl_path,
+                        output_docx_path=output_docx_path,
+                        output_xlsx_path=output_xlsx_path,
+                        parallel=reporting_cfg.get("parallel", True),
+                        process_min_records=reporting_cfg.get("process_min_records", 500),
+                        output_parquet_path=output_parquet_path,
+                        run_metadata=self._run_metadata()
+                    )
+                    record_metric(**{f"{name}_seconds": s for name, s in artifact_seconds.items()})
+                    if manifest is not None:
+                        manifest.complete("stages", "formatting", formatting_hash, {
+                            "docx": output_docx_path.name,
+                            "xlsx": output_xlsx_path.name,
+                            "parquet": output_parquet_path.name
+                        })
+
+            # 4. Portfolio Index (utils/portfolio_store.py)
+            if self.portfolio is not None:
+                logger.info(">>> Stage 4: Portfolio Index <<<")
+                with metrics.stage("portfolio"):
+                    self._ingest_portfolio(consolidated_json_path)
 
             logger.info(f"✅ Pipeline successful for {self.run_dir.name}")
 
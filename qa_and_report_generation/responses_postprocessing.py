@@ -1,15 +1,23 @@
 import json
 import re
 import sys
+import asyncio
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
-from litellm import completion
 from utils.logger import logging
 from utils.exception import CustomException
+from utils.llm_resilience import RetryPolicy, AsyncRateLimiter, aresilient_completion, record_fallback
+from utils.run_metrics import metrics_labels
+from qa_and_report_generation.run_manifest import RunManifest
 
 logger = logging.getLogger(__name__)
 
+NOT_DISCLOSED = "Not disclosed in the report."
+
+# Splits raw answers in front of every `<ID>:` record header
+RECORD_SPLIT = re.compile(r"(?:\n|^)(?=[A-Z]{1,3}_[0-9]{2}:)")
+
 # --------------------------------------------------
 # Parser Logic
 # --------------------------------------------------
@@ -29,37 +37,60 @@ def parse_model_answers(raw_text: str) -> List[Dict[str, Any]]:
 # --------------------------------------------------
 
     try:
-        records = []
         # FIX: Updated regex to handle start of string (^) or newline (\n)
-        blocks = re.split(r"(?:\n|^)(?=[A-Z]{1,3}_[0-9]{2}:)", raw_text.strip())
-
-        for block in blocks:
-            lines = [l.strip() for l in block.splitlines() if l.strip()]
-            if not lines or not re.match(r"[A-Z]{1,3}_[0-9]{2}:", lines[0]):
-                continue
-
-            record = {
-                "metric_id": lines[0].replace(":", ""),
-                "answer": None,
-                "page": None,
-                "evidence": None,
-            }
-
-            for line in lines[1:]:
-                if line.startswith("Answer:"):
-                    record["answer"] = line.split(":", 1)[1].strip()
-                elif line.startswith("Page:"):
-                    record["page"] = line.split(":", 1)[1].strip()
-                elif line.startswith("Evidence:"):
-                    record["evidence"] = line.split(":", 1)[1].strip()
-
-            records.append(record)
+        blocks = RECORD_SPLIT.split(raw_text.strip())
+        records = [r for r in (_parse_block(b) for b in blocks) if r is not None]
         
         logger.info(f"Parsed {len(records)} records from raw text.")
         return records
     except Exception as e:
         raise CustomException(e, sys)
 
+def _parse_block(block: str) -> Optional[Dict[str, Any]]:
+    """Parses one `<ID>: / Answer / Page / Evidence` block (None if it is not a record)."""
+    lines = [l.strip() for l in block.splitlines() if l.strip()]
+    if not lines or not re.match(r"[A-Z]{1,3}_[0-9]{2}:", lines[0]):
+        return None
+
+    record = {
+        "metric_id": lines[0].replace(":", ""),
+        "answer": None,
+        "page": None,
+        "evidence": None,
+    }
+
+    for line in lines[1:]:
+        if line.startswith("Answer:"):
+            record["answer"] = line.split(":", 1)[1].strip()
+        elif line.startswith("Page:"):
+            record["page"] = line.split(":", 1)[1].strip()
+        elif line.startswith("Evidence:"):
+            record["evidence"] = line.split(":", 1)[1].strip()
+
+    return record
+
+class IncrementalAnswerParser:
+    """
+    Streaming counterpart of `parse_model_answers`: text can be fed in any pieces
+    (whole batch answers or streamed deltas). A record is emitted once the next record
+    header arrives, or on `flush()` at the end of an answer.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self._buffer += text
+        blocks = RECORD_SPLIT.split(self._buffer)
+        # The last block may still be growing
+        self._buffer = blocks[-1]
+        return [r for r in (_parse_block(b) for b in blocks[:-1]) if r is not None]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        record = _parse_block(self._buffer)
+        self._buffer = ""
+        return [record] if record is not None else []
+
 # --------------------------------------------------
 # Consolidation Logic
 # --------------------------------------------------
@@ -90,31 +121,313 @@ OUTPUT FORMAT (JSON ONLY):
 }}
 """
 
-def consolidate_records(records: List[Dict[str, Any]], model: str) -> List[Dict[str, Any]]:
-    consolidated = []
-    logger.info(f"Starting second-pass consolidation using model: {model}...")
+def build_packed_consolidation_prompt(records: List[Dict[str, Any]]) -> str:
+    """Constructs one consolidation prompt covering several records."""
+    return f"""
+You are performing a SECOND-PASS ESG CONSOLIDATION task.
+
+This is NOT extraction. This is NOT interpretation. This is NOT analysis.
+
+RULES:
+- Treat every input record independently. Use ONLY that record's fields.
+- Do NOT add new facts, numbers, or assumptions.
+- Do NOT change page numbers.
+- If the 'answer' is empty but 'evidence' exists, produce a concise factual summary.
+- If both are empty, summary MUST be "{NOT_DISCLOSED}"
+- Return exactly one output record per input record, with the same metric_id.
+
+INPUT (JSON LIST):
+{json.dumps(records, indent=2)}
+
+OUTPUT FORMAT (JSON ONLY):
+{{
+  "records": [
+    {{
+      "metric_id": "<metric_id>",
+      "summary": "<concise factual summary>",
+      "key_facts": ["<fact 1>", "<fact 2>"],
+      "page": "<page exactly as in the input>"
+    }}
+  ]
+}}
+"""
 
-    for rec in records:
+def _load_json_content(response) -> Any:
+    # FIX: Clean potential Markdown wrapping before loading JSON
+    content = response.choices[0].message.content.strip()
+    content = re.sub(r"^```json\s*|\s*```$", "", content, flags=re.MULTILINE)
+    return json.loads(content)
+
+def _is_blank(value: Optional[str]) -> bool:
+    return not value or not value.strip().strip('"').strip()
+
+def resolve_deterministically(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Consolidates records that need no LLM: answer marked not disclosed, or answer and
+    evidence both empty. Returns None when the record needs a model pass.
+    """
+    answer = (record.get("answer") or "").strip()
+    not_disclosed = answer.rstrip(".").lower() == NOT_DISCLOSED.rstrip(".").lower()
+
+    if not_disclosed or (_is_blank(answer) and _is_blank(record.get("evidence"))):
+        return {
+            "metric_id": record["metric_id"],
+            "summary": NOT_DISCLOSED,
+            "key_facts": [],
+            "page": f"{record['page']}"
+        }
+    return None
+
+async def _consolidate_single(
+    record: Dict[str, Any],
+    model: str,
+    policy: Optional[RetryPolicy],
+    limiter: AsyncRateLimiter
+) -> Optional[Dict[str, Any]]:
+    try:
+        await limiter.wait()
+        response = await aresilient_completion(
+            model=model,
+            messages=[{"role": "user", "content": build_consolidation_prompt(record)}],
+            policy=policy,
+            response_format={"type": "json_object"}
+        )
+        return _load_json_content(response)
+    except Exception as e:
+        logger.error(f"Consolidation failed for {record.get('metric_id', 'Unknown')}: {str(e)}")
+        record_fallback("consolidate_records")
+        return None
+
+async def _consolidate_pack(
+    pack: List[Dict[str, Any]],
+    model: str,
+    policy: Optional[RetryPolicy],
+    limiter: AsyncRateLimiter
+) -> Dict[str, Dict[str, Any]]:
+    """
+    One LLM call for several records; records missing from the reply are retried singly.
+    Every call (packed or single) waits on `limiter` first.
+    """
+    outputs: Dict[str, Dict[str, Any]] = {}
+
+    if len(pack) > 1:
         try:
-            prompt = build_consolidation_prompt(rec)
-            response = completion(
+            await limiter.wait()
+            response = await aresilient_completion(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=[{"role": "user", "content": build_packed_consolidation_prompt(pack)}],
+                policy=policy,
                 response_format={"type": "json_object"}
             )
+            for out in _load_json_content(response).get("records", []):
+                if isinstance(out, dict) and out.get("metric_id"):
+                    outputs[out["metric_id"]] = out
+        except Exception as e:
+            logger.warning(f"Packed consolidation failed for {[r['metric_id'] for r in pack]}: {e}")
 
-            # FIX: Clean potential Markdown wrapping before loading JSON
-            content = response.choices[0].message.content.strip()
-            content = re.sub(r"^```json\s*|\s*```$", "", content, flags=re.MULTILINE)
-            
-            output = json.loads(content)
-            consolidated.append(output)
+    for rec in pack:
+        if rec["metric_id"] not in outputs:
+            single = await _consolidate_single(rec, model, policy, limiter)
+            if single is not None:
+                outputs[rec["metric_id"]] = single
 
-        except Exception as e:
-            logger.error(f"Consolidation failed for {rec.get('metric_id', 'Unknown')}: {str(e)}")
-            continue
+    return outputs
+
+async def aconsolidate_records(
+    records: List[Dict[str, Any]],
+    model: str,
+    policy: Optional[RetryPolicy] = None,
+    pack_size: int = 5,
+    max_concurrency: int = 4,
+    requests_per_minute: Optional[float] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    limiter: Optional[AsyncRateLimiter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Consolidation engine:
+    1. not-disclosed / empty records are resolved without an LLM,
+    2. the rest are packed `pack_size` per call,
+    3. packs run concurrently (semaphore + rate limiter).
+    Output keeps the input record order; records that fail consolidation are dropped.
+    Pass a shared `semaphore` / `limiter` to bound several concurrent invocations together.
+    """
+    logger.info(f"Starting second-pass consolidation using model: {model}...")
+
+    resolved: Dict[int, Dict[str, Any]] = {}
+    needs_llm: List[int] = []
+    for i, rec in enumerate(records):
+        shortcut = resolve_deterministically(rec)
+        if shortcut is not None:
+            resolved[i] = shortcut
+        else:
+            needs_llm.append(i)
+
+    packs = [needs_llm[i:i + max(1, pack_size)] for i in range(0, len(needs_llm), max(1, pack_size))]
+    logger.info(
+        f"Consolidation plan: {len(resolved)} resolved deterministically, "
+        f"{len(needs_llm)} via LLM in {len(packs)} call(s)."
+    )
 
-    return consolidated
+    semaphore = semaphore or asyncio.Semaphore(max(1, max_concurrency))
+    limiter = limiter or AsyncRateLimiter(requests_per_minute)
+
+    async def run_pack(indices: List[int]):
+        async with semaphore:
+            outputs = await _consolidate_pack([records[i] for i in indices], model, policy, limiter)
+        for i in indices:
+            out = outputs.get(records[i]["metric_id"])
+            if out is not None:
+                resolved[i] = out
+
+    await asyncio.gather(*(run_pack(p) for p in packs))
+
+    return [resolved[i] for i in range(len(records)) if i in resolved]
+
+def consolidate_records(
+    records: List[Dict[str, Any]],
+    model: str,
+    policy: Optional[RetryPolicy] = None,
+    pack_size: int = 5,
+    max_concurrency: int = 4,
+    requests_per_minute: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Synchronous entry point for `aconsolidate_records`."""
+    return asyncio.run(
+        aconsolidate_records(
+            records,
+            model=model,
+            policy=policy,
+            pack_size=pack_size,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute
+        )
+    )
+
+async def aconsolidate_with_checkpoints(
+    records: List[Dict[str, Any]],
+    model: str,
+    manifest: Optional[RunManifest],
+    policy: Optional[RetryPolicy] = None,
+    consolidation: Optional[Dict[str, Any]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    limiter: Optional[AsyncRateLimiter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Consolidates only records without a completed manifest entry for the same input
+    (record + model); reused and new outputs are returned in input record order.
+    Without a manifest every record is consolidated.
+    """
+    consolidation = consolidation or {}
+    hashes = [RunManifest.input_hash(rec, model) for rec in records]
+
+    outputs: Dict[int, Dict[str, Any]] = {}
+    todo: List[int] = []
+    for i, rec in enumerate(records):
+        stored = manifest.get("consolidated", rec["metric_id"], hashes[i]) if manifest else None
+        if stored is not None:
+            outputs[i] = stored
+        else:
+            todo.append(i)
+
+    if manifest is not None:
+        logger.info(f"Consolidation checkpoint: {len(outputs)} reused, {len(todo)} to process.")
+
+    if todo:
+        fresh = await aconsolidate_records(
+            [records[i] for i in todo],
+            model=model,
+            policy=policy,
+            pack_size=consolidation.get("pack_size", 5),
+            max_concurrency=consolidation.get("max_concurrency", 4),
+            requests_per_minute=consolidation.get("requests_per_minute"),
+            semaphore=semaphore,
+            limiter=limiter
+        )
+        by_id = {out.get("metric_id"): out for out in fresh}
+        for i in todo:
+            metric_id = records[i]["metric_id"]
+            out = by_id.get(metric_id)
+            if out is not None:
+                outputs[i] = out
+                if manifest is not None:
+                    manifest.complete("consolidated", metric_id, hashes[i], out)
+            elif manifest is not None:
+                manifest.fail("consolidated", metric_id, hashes[i], "consolidation failed")
+
+    return [outputs[i] for i in range(len(records)) if i in outputs]
+
+def consolidate_with_checkpoints(
+    records: List[Dict[str, Any]],
+    model: str,
+    manifest: RunManifest,
+    policy: Optional[RetryPolicy] = None,
+    consolidation: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Synchronous entry point for `aconsolidate_with_checkpoints`."""
+    return asyncio.run(
+        aconsolidate_with_checkpoints(
+            records, model=model, manifest=manifest, policy=policy, consolidation=consolidation
+        )
+    )
+
+class StreamingConsolidator:
+    """
+    Overlaps parsing and consolidation with extraction: each finished batch answer is
+    parsed incrementally and its records are consolidated in a background task on the
+    extraction event loop, sharing one concurrency limit and rate limiter across batches.
+    Must be used from inside that event loop; `drain()` awaits the outstanding work.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        policy: Optional[RetryPolicy] = None,
+        consolidation: Optional[Dict[str, Any]] = None,
+        manifest: Optional[RunManifest] = None
+    ):
+        self.model = model
+        self.policy = policy
+        self.consolidation = consolidation or {}
+        self.manifest = manifest
+
+        self.parser = IncrementalAnswerParser()
+        self.extracted_records: List[Dict[str, Any]] = []
+        self.consolidated_records: List[Dict[str, Any]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._limiter: Optional[AsyncRateLimiter] = None
+
+    def submit_answer(self, batch_name: str, raw_answer: str):
+        """Parses one batch answer and schedules consolidation of its records."""
+        records = self.parser.feed(raw_answer) + self.parser.flush()
+        self.extracted_records.extend(records)
+        if not records:
+            return
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.consolidation.get("max_concurrency", 4)))
+            self._limiter = AsyncRateLimiter(self.consolidation.get("requests_per_minute"))
+
+        logger.info(f"Streaming {len(records)} parsed records from batch {batch_name} into consolidation.")
+        # The task copies the current context: attribute its LLM calls to consolidation
+        with metrics_labels(stage="post_processing", batch=batch_name):
+            self._tasks.append(asyncio.create_task(
+                aconsolidate_with_checkpoints(
+                    records,
+                    model=self.model,
+                    manifest=self.manifest,
+                    policy=self.policy,
+                    consolidation=self.consolidation,
+                    semaphore=self._semaphore,
+                    limiter=self._limiter
+                )
+            ))
+
+    async def drain(self) -> List[Dict[str, Any]]:
+        """Waits for every scheduled batch and returns consolidated records in submission order."""
+        results = await asyncio.gather(*self._tasks)
+        self.consolidated_records = [rec for batch in results for rec in batch]
+        return self.consolidated_records
 
 # --------------------------------------------------
 # Pipeline Function
@@ -124,10 +437,15 @@ def run_post_processing_pipeline(
     input_file: Path,
     intermediate_file: Path,
     output_file: Path,
-    model: str
+    model: str,
+    policy: Optional[RetryPolicy] = None,
+    consolidation: Optional[Dict[str, Any]] = None,
+    manifest: Optional[RunManifest] = None
 ):
     """
     Modular execution logic for parsing and consolidating ESG data.
+    `consolidation` is the config block with pack_size / max_concurrency / requests_per_minute.
+    With a `manifest`, parsing and per-record consolidation resume from earlier checkpoints.
     """
     try:
         if not input_file.exists():
@@ -136,7 +454,12 @@ def run_post_processing_pipeline(
         # 1. Parse Raw Text
         logger.info(f"Step 1: Parsing raw answers from {input_file}")
         raw_text = input_file.read_text(encoding="utf-8")
-        extracted_records = parse_model_answers(raw_text)
+        parse_hash = RunManifest.input_hash(raw_text)
+        extracted_records = manifest.get("parsed", input_file.name, parse_hash) if manifest else None
+        if extracted_records is None:
+            extracted_records = parse_model_answers(raw_text)
+            if manifest is not None:
+                manifest.complete("parsed", input_file.name, parse_hash, extracted_records)
         
         # Save intermediate
         intermediate_file.write_text(
@@ -146,7 +469,21 @@ def run_post_processing_pipeline(
 
         # 2. Consolidate
         logger.info("Step 2: Consolidating records...")
-        final_data = consolidate_records(extracted_records, model=model)
+        consolidation = consolidation or {}
+        if manifest is not None:
+            final_data = consolidate_with_checkpoints(
+                extracted_records, model=model, manifest=manifest,
+                policy=policy, consolidation=consolidation
+            )
+        else:
+            final_data = consolidate_records(
+                extracted_records,
+                model=model,
+                policy=policy,
+                pack_size=consolidation.get("pack_size", 5),
+                max_concurrency=consolidation.get("max_concurrency", 4),
+                requests_per_minute=consolidation.get("requests_per_minute")
+            )
 
         # 3. Save Final
         output_file.write_text(
@@ -157,3 +494,59 @@ def run_post_processing_pipeline(
 
     except Exception as e:
         raise CustomException(e, sys)
+
+
+def write_post_processing_outputs(
+    extracted_records: List[Dict[str, Any]],
+    final_data: List[Dict[str, Any]],
+    intermediate_file: Path,
+    output_file: Path
+):
+    """Writes records already parsed and consolidated during extraction (streaming mode)."""
+    try:
+        intermediate_file.write_text(
+            json.dumps(extracted_records, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        output_file.write_text(
+            json.dumps(final_data, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        logger.info(f"Streamed post-processing: {len(final_data)} metrics written to {output_file}.")
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def run_structured_post_processing(
+    records: List[Dict[str, Any]],
+    intermediate_file: Path,
+    output_file: Path
+):
+    """
+    Structured-extraction counterpart of `run_post_processing_pipeline`: records already carry
+    summary/key_facts, so they are split into the intermediate and consolidated files without
+    regex parsing or a second LLM pass.
+    """
+    try:
+        extracted_records = [
+            {k: rec.get(k) for k in ("metric_id", "answer", "page", "evidence")}
+            for rec in records
+        ]
+        intermediate_file.write_text(
+            json.dumps(extracted_records, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+
+        final_data = [
+            {k: rec.get(k) for k in ("metric_id", "summary", "key_facts", "page")}
+            for rec in records
+        ]
+        output_file.write_text(
+            json.dumps(final_data, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        logger.info(f"Structured records: {len(final_data)} metrics written to {output_file} (no refinement pass).")
+
+    except Exception as e:
+        raise CustomException(e, sys)
@@ -1,19 +1,48 @@
 import json
 import sys
+import time
+import asyncio
 from pathlib import Path
 from typing import Dict, List, Tuple, Any, Optional
 
 from tqdm import tqdm
-from litellm import completion
-from tenacity import retry, stop_after_attempt, wait_exponential
+from pydantic import BaseModel, Field
 
 # Custom Imports
 from utils.logger import logging
 from utils.exception import CustomException
+from utils.llm_resilience import (
+    RetryPolicy,
+    resilient_completion,
+    aresilient_completion,
+    resilience_stats
+)
+from utils.run_metrics import metrics_labels, record_metric
 from retrieval_and_postprocessing.retrieval_full_pipeline import AdvancedRAGRetrievalEngine
+from retrieval_and_postprocessing.principle_routing import route_batch
+from qa_and_report_generation.context_packing import pack_context
+from qa_and_report_generation.run_manifest import RunManifest
+from qa_and_report_generation.audit_rendering import chunk_refs
+from qa_and_report_generation.evidence_gate import measure_evidence, split_by_evidence
+from qa_and_report_generation.responses_postprocessing import StreamingConsolidator
 
 logger = logging.getLogger(__name__)
 
+NOT_DISCLOSED = "Not disclosed in the report."
+
+# --- DATA MODELS ---
+
+class ExtractedMetric(BaseModel):
+    metric_id: str = Field(description="The question ID exactly as given, e.g. ENV_03")
+    answer: str = Field(description=f"Verbatim statement from the context, or '{NOT_DISCLOSED}'")
+    page: str = Field(description="Page number(s) the answer was taken from, or 'N/A'")
+    evidence: str = Field(description="Exact quote from the context supporting the answer, or ''")
+    summary: str = Field(description=f"Concise factual summary of the answer only, or '{NOT_DISCLOSED}'")
+    key_facts: list[str] = Field(description="Individual facts/figures stated in the answer; empty if not disclosed")
+
+class BatchExtraction(BaseModel):
+    records: list[ExtractedMetric] = Field(description="Exactly one record per question ID in the batch")
+
 # --- CORE RAG UTILS ---
 
 def make_rag_messages(question: str, chunks: List[Any], history: Optional[List[Dict]] = None) -> List[Dict]:
@@ -40,32 +69,142 @@ def make_rag_messages(question: str, chunks: List[Any], history: Optional[List[D
         raise CustomException(e, sys)
 
 
-@retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3))
+def build_batch_prompt(batch_name: str, questions: List[Dict]) -> str:
+    """Builds the combined extraction instructions for all questions in a batch."""
+    combined_prompt = (
+        f"You are performing an ESG audit extraction task for the section: {batch_name}.\n"
+        "STRICT: Use ONLY the provided context. Cite exact page numbers. No summaries.\n\n"
+        "ANSWER FORMAT PER QUESTION:\n"
+        "<QUESTION_ID>:\n"
+        "Answer: <verbatim statement or 'Not disclosed in the report.'>\n"
+        "Page: <page number or 'N/A'>\n"
+        "Evidence: \"<exact quote>\"\n\n"
+        "QUESTIONS:\n"
+    )
+
+    for q in questions:
+        combined_prompt += f"{q['id']}. {q['question']}\n"
+
+    return combined_prompt
+
+
 def answer_batch(
     batch_name: str,
     questions: List[Dict],
     chunks: List[Any],
-    model: str = "openai/gpt-4.1-mini"
+    model: str = "openai/gpt-4.1-mini",
+    policy: Optional[RetryPolicy] = None
 ) -> Dict[str, Any]:
     """Extracts information for all questions in a batch using a single LLM call."""
     try:
-        combined_prompt = (
-            f"You are performing an ESG audit extraction task for the section: {batch_name}.\n"
-            "STRICT: Use ONLY the provided context. Cite exact page numbers. No summaries.\n\n"
-            "ANSWER FORMAT PER QUESTION:\n"
-            "<QUESTION_ID>:\n"
-            "Answer: <verbatim statement or 'Not disclosed in the report.'>\n"
-            "Page: <page number or 'N/A'>\n"
-            "Evidence: \"<exact quote>\"\n\n"
-            "QUESTIONS:\n"
+        combined_prompt = build_batch_prompt(batch_name, questions)
+        messages = make_rag_messages(question=combined_prompt, chunks=chunks)
+        response = resilient_completion(model=model, messages=messages, policy=policy)
+        
+        return {
+            "batch": batch_name,
+            "raw_answer": response.choices[0].message.content.strip(),
+            "num_chunks_used": len(chunks)
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def build_structured_batch_prompt(batch_name: str, questions: List[Dict]) -> str:
+    """Extraction + consolidation instructions for the single-call structured mode."""
+    combined_prompt = (
+        f"You are performing an ESG audit extraction task for the section: {batch_name}.\n"
+        "STRICT: Use ONLY the provided context. Cite exact page numbers.\n\n"
+        "Return exactly one record per question ID below with:\n"
+        f"- answer: verbatim statement from the context or '{NOT_DISCLOSED}'\n"
+        "- page: page number(s) or 'N/A'\n"
+        "- evidence: exact quote supporting the answer\n"
+        "- summary: concise factual summary of the answer. Do NOT add new facts, numbers or assumptions.\n"
+        "- key_facts: the individual facts/figures stated in the answer\n"
+        f"If nothing relevant is in the context, answer and summary MUST be '{NOT_DISCLOSED}' "
+        "and key_facts MUST be empty.\n\n"
+        "QUESTIONS:\n"
+    )
+
+    for q in questions:
+        combined_prompt += f"{q['id']}. {q['question']}\n"
+
+    return combined_prompt
+
+
+def render_records_as_text(records: List[Dict[str, Any]]) -> str:
+    """Renders structured records in the legacy `<ID>: Answer/Page/Evidence` layout (audit + parser)."""
+    blocks = []
+    for rec in records:
+        blocks.append(
+            f"{rec['metric_id']}:\n"
+            f"Answer: {rec.get('answer') or NOT_DISCLOSED}\n"
+            f"Page: {rec.get('page') or 'N/A'}\n"
+            f"Evidence: \"{rec.get('evidence') or ''}\""
         )
+    return "\n\n".join(blocks)
+
 
-        for q in questions:
-            combined_prompt += f"{q['id']}. {q['question']}\n"
+def _align_structured_records(questions: List[Dict], extraction: BatchExtraction) -> List[Dict[str, Any]]:
+    """Keeps one record per batch question in question order; missing IDs become 'not disclosed'."""
+    by_id = {r.metric_id.strip(): r.model_dump() for r in extraction.records}
+    aligned = []
+    for q in questions:
+        rec = by_id.get(q["id"])
+        if rec is None:
+            logger.warning(f"Structured extraction returned no record for {q['id']}.")
+            rec = ExtractedMetric(
+                metric_id=q["id"], answer=NOT_DISCLOSED, page="N/A",
+                evidence="", summary=NOT_DISCLOSED, key_facts=[]
+            ).model_dump()
+        aligned.append(rec)
+    return aligned
 
+
+async def aanswer_batch_structured(
+    batch_name: str,
+    questions: List[Dict],
+    chunks: List[Any],
+    model: str = "openai/gpt-4.1-mini",
+    policy: Optional[RetryPolicy] = None
+) -> Dict[str, Any]:
+    """
+    Single-call structured extraction: returns validated records carrying answer, page,
+    evidence, summary and key_facts, so no second consolidation pass is needed.
+    """
+    try:
+        combined_prompt = build_structured_batch_prompt(batch_name, questions)
         messages = make_rag_messages(question=combined_prompt, chunks=chunks)
-        response = completion(model=model, messages=messages)
-        
+        response = await aresilient_completion(
+            model=model, messages=messages, policy=policy, response_format=BatchExtraction
+        )
+
+        extraction = BatchExtraction.model_validate_json(response.choices[0].message.content)
+        records = _align_structured_records(questions, extraction)
+
+        return {
+            "batch": batch_name,
+            "raw_answer": render_records_as_text(records),
+            "records": records,
+            "num_chunks_used": len(chunks)
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+async def aanswer_batch(
+    batch_name: str,
+    questions: List[Dict],
+    chunks: List[Any],
+    model: str = "openai/gpt-4.1-mini",
+    policy: Optional[RetryPolicy] = None
+) -> Dict[str, Any]:
+    """Async (litellm `acompletion`) variant of `answer_batch`."""
+    try:
+        combined_prompt = build_batch_prompt(batch_name, questions)
+        messages = make_rag_messages(question=combined_prompt, chunks=chunks)
+        response = await aresilient_completion(model=model, messages=messages, policy=policy)
+
         return {
             "batch": batch_name,
             "raw_answer": response.choices[0].message.content.strip(),
@@ -75,6 +214,64 @@ def answer_batch(
         raise CustomException(e, sys)
 
 
+def gated_chunks(gated: List[Dict[str, Any]]) -> List[Any]:
+    """De-duplicated union of the chunks retrieved for gated questions (in retrieval order)."""
+    return list({id(chunk): chunk for g in gated for chunk in g.get("chunks", [])}.values())
+
+
+def abstained_record(metric_id: str) -> Dict[str, Any]:
+    """'Not disclosed' record for a question the evidence gate kept away from the extraction model."""
+    return ExtractedMetric(
+        metric_id=metric_id, answer=NOT_DISCLOSED, page="N/A",
+        evidence="", summary=NOT_DISCLOSED, key_facts=[]
+    ).model_dump()
+
+
+async def aanswer_batch_gated(
+    batch_name: str,
+    questions: List[Dict],
+    chunks: List[Any],
+    gated: List[Dict[str, Any]],
+    model: str = "openai/gpt-4.1-mini",
+    cheap_model: Optional[str] = None,
+    policy: Optional[RetryPolicy] = None,
+    structured: bool = False
+) -> Dict[str, Any]:
+    """
+    Batch extraction behind the evidence gate: gated questions are either answered as
+    'not disclosed' without an LLM call ('drop') or by `cheap_model` ('cheap_model') over
+    only the chunks retrieved for them; the rest go to `model` with the batch `chunks`.
+    The gate decisions are returned as `abstentions` for the audit trail.
+    """
+    answer_fn = aanswer_batch_structured if structured else aanswer_batch
+    gated_ids = {g["metric_id"] for g in gated}
+    cheap_gated = [g for g in gated if g["action"] == "cheap_model" and cheap_model]
+    cheap = [g["question"] for g in cheap_gated]
+    cheap_chunks = gated_chunks(cheap_gated)
+    dropped = [g["metric_id"] for g in gated if g["metric_id"] not in {q["id"] for q in cheap}]
+
+    parts = []
+    kept = [q for q in questions if q["id"] not in gated_ids]
+    if kept:
+        parts.append(await answer_fn(batch_name, kept, chunks, model=model, policy=policy))
+    if cheap:
+        parts.append(await answer_fn(batch_name, cheap, cheap_chunks, model=cheap_model, policy=policy))
+    if dropped:
+        records = [abstained_record(metric_id) for metric_id in dropped]
+        parts.append({"raw_answer": render_records_as_text(records), "records": records})
+
+    result = {
+        "batch": batch_name,
+        "raw_answer": "\n\n".join(part["raw_answer"] for part in parts),
+        "num_chunks_used": (len(chunks) if kept else 0) + (len(cheap_chunks) if cheap else 0),
+        "abstentions": [{k: v for k, v in g.items() if k not in ("question", "chunks")} for g in gated],
+    }
+    if structured:
+        by_id = {rec["metric_id"]: rec for part in parts for rec in part.get("records", [])}
+        result["records"] = [by_id[q["id"]] for q in questions if q["id"] in by_id]
+    return result
+
+
 # --- DATA HANDLING ---
 
 def load_questions_by_batch(path: str) -> Dict[str, List[Dict]]:
@@ -97,78 +294,376 @@ def load_questions_by_batch(path: str) -> Dict[str, List[Dict]]:
 
 # --- EXECUTION PIPELINE ---
 
+def retrieve_batch_context(
+    engine: AdvancedRAGRetrievalEngine,
+    batch_name: str,
+    questions: List[Dict],
+    packing: Optional[Dict] = None,
+    gate: Optional[Dict] = None
+) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """
+    Retrieves and de-duplicates the union of context chunks for every question in a batch.
+    Each kept chunk records how many questions retrieved it and its best distance; when
+    `packing` is enabled the union is packed under its token budget.
+    With the evidence `gate` enabled, questions whose retrieval is weak on both similarity
+    and keyword coverage are returned as gated entries, and chunks retrieved only for gated
+    questions are left out of the batch context; 'cheap_model' entries carry their own
+    retrieved `chunks` for the cheap call.
+    """
+    all_chunks = []
+    seen_chunks: Dict[Tuple[Any, int], Any] = {}
+    served_by: Dict[Tuple[Any, int], set] = {}
+    evidence: Dict[str, Dict[str, Any]] = {}
+    principles = route_batch(batch_name, questions)
+
+    for q in tqdm(questions, desc=f"Retrieving [{batch_name}]", unit="q"):
+        context, _ = engine.get_context_advanced(q["question"], principles=principles)
+        evidence[q["id"]] = measure_evidence(q["question"], context)
+        for chunk in context:
+            dedup_key = (chunk.metadata.get("page", "N/A"), hash(chunk.page_content))
+            served_by.setdefault(dedup_key, set()).add(q["id"])
+            kept = seen_chunks.get(dedup_key)
+            if kept is None:
+                chunk.metadata["questions_served"] = 1
+                seen_chunks[dedup_key] = chunk
+                all_chunks.append(chunk)
+                continue
+
+            kept.metadata["questions_served"] += 1
+            distance = chunk.metadata.get("distance")
+            if distance is not None and distance < kept.metadata.get("distance", float("inf")):
+                kept.metadata["distance"] = distance
+
+    logging.info(f"Retrieved {len(all_chunks)} unique context chunks for batch {batch_name}.")
+
+    _, gated = split_by_evidence(questions, evidence, gate)
+    if gated:
+        gated_ids = {g["metric_id"] for g in gated}
+        all_chunks = [chunk for key, chunk in seen_chunks.items() if not served_by[key] <= gated_ids]
+        for g in gated:
+            if g["action"] == "cheap_model":
+                g["chunks"] = [chunk for key, chunk in seen_chunks.items() if g["metric_id"] in served_by[key]]
+        dropped = sum(g["action"] == "drop" for g in gated)
+        logging.info(
+            f"Evidence gate [{batch_name}]: {len(gated)}/{len(questions)} questions gated "
+            f"({dropped} dropped); {len(all_chunks)} chunks kept for the extraction model."
+        )
+
+    if packing and packing.get("enabled", False):
+        all_chunks, stats = pack_context(
+            all_chunks,
+            max_tokens=packing.get("max_context_tokens", 16000),
+            encoding_name=packing.get("encoding", "o200k_base"),
+            coverage_weight=packing.get("coverage_weight", 0.5)
+        )
+        logging.info(
+            f"Packed batch {batch_name}: {stats['chunks_before']} -> {stats['chunks_after']} chunks, "
+            f"{stats['tokens_before']} -> {stats['tokens_after']} tokens "
+            f"(saved {stats['tokens_saved']}, trimmed {stats['lines_trimmed']} overlapping lines)."
+        )
+
+    return all_chunks, gated
+
+
+def write_batch_outputs(
+    audit_refs_path: Path,
+    answers_txt_path: Path,
+    batch_name: str,
+    raw_answer: str,
+    refs: List[Dict[str, Any]],
+    abstentions: Optional[List[Dict[str, Any]]] = None
+):
+    """
+    Appends one batch to the audit reference file and the raw answers file.
+    The Markdown audit log is rendered from the references on demand (audit_rendering.py).
+    """
+    # 1. Compact audit record (chunk ids, pages, scores) instead of chunk text
+    with open(audit_refs_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "batch": batch_name, "raw_answer": raw_answer, "chunks": refs, "abstentions": abstentions or []
+        }, ensure_ascii=False) + "\n")
+    
+    # 2. Write raw text for downstream machine parsing
+    with open(answers_txt_path, "a", encoding="utf-8") as f:
+        f.write(f"\n{raw_answer}\n\n") 
+
+
+def _union_length(intervals: List[Tuple[float, float]]) -> float:
+    """Total length covered by a set of (start, end) intervals."""
+    total, cur_start, cur_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        else:
+            cur_end = max(cur_end, end)
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+
+def log_stage_overlap(timings: Dict[str, Dict[str, float]], wall_time: float):
+    """Logs per-batch stage windows and how much retrieval overlapped extraction."""
+    retrieval = [(t["retrieval_start"], t["retrieval_end"]) for t in timings.values() if "retrieval_end" in t]
+    extraction = [(t["extraction_start"], t["extraction_end"]) for t in timings.values() if "extraction_end" in t]
+
+    for batch_name, t in timings.items():
+        if "extraction_end" not in t:
+            continue
+        logging.info(
+            f"[Timing] {batch_name}: retrieval {t['retrieval_start']:.1f}-{t['retrieval_end']:.1f}s | "
+            f"queued {t['extraction_start'] - t['retrieval_end']:.1f}s | "
+            f"extraction {t['extraction_start']:.1f}-{t['extraction_end']:.1f}s"
+        )
+
+    retrieval_busy = _union_length(retrieval)
+    extraction_busy = _union_length(extraction)
+    overlap = retrieval_busy + extraction_busy - _union_length(retrieval + extraction)
+    logging.info(
+        f"[Timing] wall={wall_time:.1f}s | retrieval busy={retrieval_busy:.1f}s | "
+        f"extraction busy={extraction_busy:.1f}s | overlap={overlap:.1f}s "
+        f"(fully serial would be ~{sum(e - s for s, e in retrieval + extraction):.1f}s)"
+    )
+
+
+async def _run_batch_pipeline(
+    engine: Optional[AdvancedRAGRetrievalEngine],
+    batches: Dict[str, List[Dict]],
+    audit_refs_path: Path,
+    answers_txt_path: Path,
+    model: str,
+    policy: Optional[RetryPolicy],
+    max_concurrency: int,
+    retrieval_workers: int = 1,
+    queue_size: int = 2,
+    packing: Optional[Dict] = None,
+    structured: bool = False,
+    gate: Optional[Dict] = None,
+    checkpoints: Optional[Dict[int, Tuple[List[Dict[str, Any]], Dict[str, Any]]]] = None,
+    manifest: Optional[RunManifest] = None,
+    batch_hashes: Optional[Dict[str, str]] = None,
+    consolidator: Optional[StreamingConsolidator] = None
+) -> List[Dict[str, Any]]:
+    """
+    Two-stage producer/consumer pipeline:
+    retrieval workers fill a bounded queue while extraction workers (at most `max_concurrency`
+    LLM calls in flight) drain it, so retrieval for batch N+1 overlaps generation for batch N.
+    Finished batches are flushed to disk strictly in question-file order.
+    Batches in `checkpoints` (index -> chunk refs, result) are flushed without being re-run;
+    the rest are recorded in `manifest` as completed or failed.
+    Each flushed answer is handed to `consolidator` (text mode), so parsing and
+    consolidation run while later batches are still being extracted.
+    Returns the structured records in question order (empty in text mode).
+    """
+    batch_items = list(batches.items())
+    checkpoints = checkpoints or {}
+    pending = asyncio.Queue()
+    for index, (batch_name, questions) in enumerate(batch_items):
+        if index not in checkpoints:
+            pending.put_nowait((index, batch_name, questions))
+
+    retrieved: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    timings: Dict[str, Dict[str, float]] = {name: {} for name, _ in batch_items}
+    pipeline_start = time.perf_counter()
+
+    def elapsed() -> float:
+        return time.perf_counter() - pipeline_start
+
+    # Deterministic ordering: buffer out-of-order completions, flush the contiguous prefix
+    finished: Dict[int, Tuple[List[Any], Optional[Dict[str, Any]]]] = dict(checkpoints)
+    ordered_records: List[Dict[str, Any]] = []
+    next_to_write = 0
+
+    def flush_ready():
+        nonlocal next_to_write
+        while next_to_write in finished:
+            refs, result = finished.pop(next_to_write)
+            batch_name = batch_items[next_to_write][0]
+            if result is not None:
+                write_batch_outputs(
+                    audit_refs_path, answers_txt_path, batch_name, result["raw_answer"], refs,
+                    abstentions=result.get("abstentions")
+                )
+                ordered_records.extend(result.get("records", []))
+                if consolidator is not None:
+                    consolidator.submit_answer(batch_name, result["raw_answer"])
+                logging.info(f"Successfully processed and saved batch: {batch_name}")
+            next_to_write += 1
+
+    async def retrieval_worker():
+        while not pending.empty():
+            index, batch_name, questions = pending.get_nowait()
+            logging.info(f"Starting Processing: Batch [{batch_name}] with {len(questions)} questions.")
+            timings[batch_name]["retrieval_start"] = elapsed()
+            with metrics_labels(stage="retrieval", batch=batch_name):
+                try:
+                    all_chunks, gated = await asyncio.to_thread(
+                        retrieve_batch_context, engine, batch_name, questions, packing, gate
+                    )
+                except Exception as e:
+                    logging.error(f"Retrieval failed for batch {batch_name}: {CustomException(e, sys)}")
+                    all_chunks, gated = None, []
+                timings[batch_name]["retrieval_end"] = elapsed()
+                record_metric(
+                    retrieval_seconds=round(timings[batch_name]["retrieval_end"] - timings[batch_name]["retrieval_start"], 3)
+                )
+            # Blocks when extraction falls behind (bounded prefetch)
+            await retrieved.put((index, batch_name, questions, all_chunks, gated))
+
+    async def extraction_worker():
+        while True:
+            item = await retrieved.get()
+            if item is None:
+                break
+            index, batch_name, questions, all_chunks, gated = item
+
+            result = None
+            if all_chunks is not None:
+                timings[batch_name]["extraction_start"] = elapsed()
+                with metrics_labels(stage="extraction", batch=batch_name):
+                    try:
+                        result = await aanswer_batch_gated(
+                            batch_name, questions, all_chunks, gated,
+                            model=model, cheap_model=(gate or {}).get("cheap_model"),
+                            policy=policy, structured=structured
+                        )
+                        record_metric(gated_questions=len(gated))
+                    except Exception as e:
+                        err = CustomException(e, sys)
+                        logging.error(f"Generation failed for batch {batch_name}: {err}")
+                    timings[batch_name]["extraction_end"] = elapsed()
+                    record_metric(
+                        extraction_seconds=round(timings[batch_name]["extraction_end"] - timings[batch_name]["extraction_start"], 3)
+                    )
+
+            # Audit trail covers the batch context plus chunks sent only to the cheap model
+            sent_ids = {c.metadata.get("chunk_id") for c in all_chunks or []}
+            refs = chunk_refs(
+                (all_chunks or []) + [c for c in gated_chunks(gated) if c.metadata.get("chunk_id") not in sent_ids]
+            )
+            if manifest is not None:
+                if result is not None:
+                    manifest.complete(
+                        "batches", batch_name, batch_hashes[batch_name], {"result": result, "chunks": refs}
+                    )
+                else:
+                    stage = "retrieval" if all_chunks is None else "extraction"
+                    manifest.fail("batches", batch_name, batch_hashes[batch_name], f"{stage} failed")
+
+            finished[index] = (refs, result)
+            flush_ready()
+
+    flush_ready()  # checkpointed batches at the head of the question order
+    n_extractors = max(1, max_concurrency)
+    producers = [asyncio.create_task(retrieval_worker()) for _ in range(max(1, retrieval_workers))]
+    consumers = [asyncio.create_task(extraction_worker()) for _ in range(n_extractors)]
+
+    await asyncio.gather(*producers)
+    for _ in consumers:
+        await retrieved.put(None)
+    await asyncio.gather(*consumers)
+
+    log_stage_overlap(timings, elapsed())
+    if consolidator is not None:
+        await consolidator.drain()
+        logging.info(f"[Timing] consolidation drained {elapsed():.1f}s after pipeline start.")
+    return ordered_records
+
+
 def run_esg_batch_extraction(
     config_path: str,
     db_path: str,
     question_path: str,
     run_dir: Path,
     model: str = "openai/gpt-4.1-mini",
-    debug_filename: str = "batchwise_responses_audit.md",
-    answers_filename: str = "batchwise_answers_only.txt"
-):
+    audit_refs_filename: str = "batchwise_audit_refs.jsonl",
+    answers_filename: str = "batchwise_answers_only.txt",
+    policy: Optional[RetryPolicy] = None,
+    max_concurrency: int = 1,
+    retrieval_workers: int = 1,
+    queue_size: int = 2,
+    packing: Optional[Dict] = None,
+    structured: bool = False,
+    gate: Optional[Dict] = None,
+    manifest: Optional[RunManifest] = None,
+    consolidator: Optional[StreamingConsolidator] = None
+) -> List[Dict[str, Any]]:
     """
     Main pipeline execution for batched RAG extraction.
-    Outputs a formatted Markdown audit log including retrieved context chunks.
+    Outputs a compact per-batch audit reference file (answers + chunk ids, pages, scores)
+    from which the Markdown audit log is rendered on demand.
+    Retrieval and extraction run as pipelined stages; up to `max_concurrency`
+    extraction calls are in flight and at most `queue_size` retrieved batches wait between them.
+    `packing` (the `context_packing` config block) bounds each batch prompt's context tokens.
+    With `structured=True` each batch is a single schema-constrained call and the validated
+    records (incl. summary/key_facts) are returned in question order.
+    `gate` (the `evidence_gate` config block) keeps low-evidence questions away from the
+    extraction model; each decision and its reason is kept in the audit references.
+    With a `consolidator` (text mode) stage 2 parsing/consolidation overlaps extraction.
+    With a `manifest`, batches completed by an earlier run on identical inputs are replayed
+    from the checkpoint and only failed or stale batches are retrieved and extracted again;
+    the audit references and answers file are rebuilt in question order either way.
     """
     try:
-        logging.info("Initializing Advanced RAG Retrieval Engine...")
-        engine = AdvancedRAGRetrievalEngine(config_path=Path(config_path), db_path=Path(db_path))
-        
-        debug_md_path = run_dir / debug_filename
+        audit_refs_path = run_dir / audit_refs_filename
         answers_txt_path = run_dir / answers_filename
         
         run_dir.mkdir(parents=True, exist_ok=True)
-        
-        debug_md_path.write_text("# ESG Audit Extraction - Process Log\n", encoding="utf-8")
-        answers_txt_path.write_text("", encoding="utf-8")
 
         batches = load_questions_by_batch(question_path)
-        logging.info(f"Loaded {len(batches)} batches for processing.")
 
-        for batch_name, questions in batches.items():
-            logging.info(f"Starting Processing: Batch [{batch_name}] with {len(questions)} questions.")
-            
-            all_chunks = []
-            seen_chunk_keys = set()
-
-            for q in tqdm(questions, desc=f"Retrieving [{batch_name}]", unit="q"):
-                context, _ = engine.get_context_advanced(q["question"])
-                for chunk in context:
-                    dedup_key = (chunk.metadata.get("page", "N/A"), hash(chunk.page_content))
-                    if dedup_key not in seen_chunk_keys:
-                        seen_chunk_keys.add(dedup_key)
-                        all_chunks.append(chunk)
-
-            logging.info(f"Retrieved {len(all_chunks)} unique context chunks for batch {batch_name}.")
-
-            try:
-                result = answer_batch(batch_name, questions, all_chunks, model=model)
-                raw_answer = result["raw_answer"]
-
-                # 1. Write formatted Markdown for human audit
-                with open(debug_md_path, "a", encoding="utf-8") as f:
-                    f.write(f"\n## Batch: **{batch_name}**\n")
-                    f.write(f"> **LLM Extraction Result:**\n>\n")
-                    f.write(f"{raw_answer}\n")
-                    
-                    # NEW: Appending all extracted chunks for this batch
-                    f.write(f"\n### 📚 Retrieved Context Chunks (Total: {len(all_chunks)})\n")
-                    for i, chunk in enumerate(all_chunks):
-                        page = chunk.metadata.get('page', 'N/A')
-                        f.write(f"\n#### Chunk {i+1} (Page {page})\n")
-                        f.write(f"```text\n{chunk.page_content}\n```\n")
-                    
-                    f.write("\n---\n")
-                
-                # 2. Write raw text for downstream machine parsing
-                with open(answers_txt_path, "a", encoding="utf-8") as f:
-                    f.write(f"\n{raw_answer}\n\n") 
+        # Checkpointed batches: inputs = questions + extraction settings + retrieval config
+        retrieval_cfg_text = Path(config_path).read_text(encoding="utf-8")
+        batch_hashes = {
+            name: RunManifest.input_hash(name, questions, model, structured, packing, gate, retrieval_cfg_text)
+            for name, questions in batches.items()
+        }
+        checkpoints: Dict[int, Tuple[List[Dict[str, Any]], Dict[str, Any]]] = {}
+        if manifest is not None:
+            for index, name in enumerate(batches):
+                stored = manifest.get("batches", name, batch_hashes[name])
+                if stored is not None:
+                    checkpoints[index] = (stored["chunks"], stored["result"])
 
-                logging.info(f"Successfully processed and saved batch: {batch_name}")
-                
-            except Exception as e:
-                err = CustomException(e, sys)
-                logging.error(f"Generation failed for batch {batch_name}: {err}")
+        logging.info(
+            f"Loaded {len(batches)} batches for processing (concurrency={max_concurrency}, "
+            f"{len(checkpoints)} restored from checkpoint)."
+        )
+
+        engine = None
+        if len(checkpoints) < len(batches):
+            logging.info("Initializing Advanced RAG Retrieval Engine...")
+            engine = AdvancedRAGRetrievalEngine(config_path=Path(config_path), db_path=Path(db_path))
+        
+        audit_refs_path.write_text("", encoding="utf-8")
+        answers_txt_path.write_text("", encoding="utf-8")
+
+        records = asyncio.run(
+            _run_batch_pipeline(
+                engine,
+                batches,
+                audit_refs_path,
+                answers_txt_path,
+                model=model,
+                policy=policy,
+                max_concurrency=max_concurrency,
+                retrieval_workers=retrieval_workers,
+                queue_size=queue_size,
+                packing=packing,
+                structured=structured,
+                gate=gate,
+                checkpoints=checkpoints,
+                manifest=manifest,
+                batch_hashes=batch_hashes,
+                consolidator=consolidator
+            )
+        )
+
+        if engine is not None and engine.llm_cache is not None:
+            logging.info(f"LLM cache stats (rewrite/rerank): {engine.llm_cache.stats()}")
+        logging.info(f"LLM resilience stats: {resilience_stats()}")
+        return records
 
     except Exception as e:
         raise CustomException(e, sys)
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.logger import logging
+from utils.exception import CustomException
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Run Manifest
+# --------------------------------------------------
+
+class RunManifest:
+    """
+    JSON checkpoint of the finished units of one report run, grouped in sections
+    ('batches', 'parsed', 'consolidated', 'stages'). Every unit stores the hash of the inputs
+    it was produced from, so a resumed run reuses only units whose inputs are unchanged
+    and re-processes failed or stale ones.
+    """
+
+    def __init__(self, path: Path, fresh: bool = False):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._reused: Dict[str, int] = {}
+        self.data: Dict[str, Any] = {"created_at": time.time(), "sections": {}}
+
+        try:
+            if self.path.exists() and not fresh:
+                self.data = json.loads(self.path.read_text(encoding="utf-8"))
+                logger.info(f"Resuming from manifest {self.path}: {self.summary()}")
+            elif fresh:
+                self.save()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def input_hash(*parts: Any) -> str:
+        """Stable SHA-256 over the JSON form of everything a unit depends on."""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _section(self, section: str) -> Dict[str, Any]:
+        return self.data["sections"].setdefault(section, {})
+
+    def get(self, section: str, unit: str, input_hash: str) -> Optional[Any]:
+        """Returns the stored output of a completed unit, or None if missing, failed or stale."""
+        with self._lock:
+            entry = self._section(section).get(unit)
+            if not entry or entry.get("status") != "completed" or entry.get("input_hash") != input_hash:
+                return None
+            self._reused[section] = self._reused.get(section, 0) + 1
+            return entry.get("output")
+
+    def complete(self, section: str, unit: str, input_hash: str, output: Any = None):
+        """Records a finished unit with its output and persists the manifest."""
+        with self._lock:
+            self._section(section)[unit] = {
+                "status": "completed",
+                "input_hash": input_hash,
+                "output": output,
+                "updated_at": time.time(),
+            }
+        self.save()
+
+    def fail(self, section: str, unit: str, input_hash: str, error: str):
+        """Records a failed unit so the next resume retries it."""
+        with self._lock:
+            self._section(section)[unit] = {
+                "status": "failed",
+                "input_hash": input_hash,
+                "error": error,
+                "updated_at": time.time(),
+            }
+        self.save()
+
+    def save(self):
+        """Atomically rewrites the manifest file (write to temp, then replace)."""
+        with self._lock:
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(self.data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Unit counts per section and status, plus units reused by this process."""
+        with self._lock:
+            counts: Dict[str, Dict[str, int]] = {}
+            for section, units in self.data.get("sections", {}).items():
+                statuses = counts.setdefault(section, {})
+                for entry in units.values():
+                    statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+                statuses["reused"] = self._reused.get(section, 0)
+            return counts
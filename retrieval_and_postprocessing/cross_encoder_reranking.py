@@ -0,0 +1,130 @@
+# retrieval_and_postprocessing\cross_encoder_reranking.py
+
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Tuple
+
+import torch
+from sentence_transformers import CrossEncoder
+
+# Your project utility imports
+from utils.logger import logging
+from utils.exception import CustomException
+from retrieval_and_postprocessing.retrieval_functions import Result
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Local CPU re-ranking with a small cross-encoder (query, chunk) relevance model.
+    Scores are computed in batches on a thread pool and cached per (query, chunk content).
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        batch_size: int = 16,
+        max_workers: int = 2,
+        cache_size: int = 4096
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.model.model.eval()
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        logger.info(f"Cross-encoder reranker loaded: {model_name} (batch={batch_size}, workers={max_workers})")
+
+    @staticmethod
+    def _chunk_key(chunk: Result) -> str:
+        """
+        Content hash of the chunk text. Chunk ids (narrative_N, table_N) repeat across runs and the
+        cache is process-wide, so ids alone would reuse another report's scores.
+        """
+        return hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: Tuple[str, str]):
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key: Tuple[str, str], score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @torch.inference_mode()
+    def _score_batch(self, question: str, texts: List[str]) -> List[float]:
+        scores = self.model.predict(
+            [(question, t) for t in texts],
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        )
+        return [float(s) for s in scores]
+
+    def score(self, question: str, chunks: List[Result]) -> List[float]:
+        """Returns one relevance score per chunk, scoring only cache misses."""
+        keys = [(question, self._chunk_key(c)) for c in chunks]
+        scores = [self._cache_get(k) for k in keys]
+
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            futures = [
+                self._executor.submit(self._score_batch, question, [chunks[i].page_content for i in batch])
+                for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                for i, s in zip(batch, future.result()):
+                    scores[i] = s
+                    self._cache_put(keys[i], s)
+
+        logger.info(f"Cross-encoder scored {len(missing)} new / {len(chunks) - len(missing)} cached pairs.")
+        return scores
+
+    def rerank(self, question: str, chunks: List[Result]) -> List[Result]:
+        """Sorts chunks by cross-encoder relevance (highest first)."""
+        if not chunks:
+            return []
+
+        try:
+            scores = self.score(question, chunks)
+            ranked = sorted(zip(chunks, scores), key=lambda pair: pair[1], reverse=True)
+
+            for chunk, s in ranked:
+                chunk.metadata["rerank_score"] = s
+            return [chunk for chunk, _ in ranked]
+
+        except Exception as e:
+            logger.warning(f"Cross-encoder reranking failed: {CustomException(e, sys)}")
+            return chunks
+
+
+@lru_cache(maxsize=4)
+def get_cross_encoder_reranker(
+    model_name: str,
+    batch_size: int = 16,
+    max_workers: int = 2,
+    cache_size: int = 4096
+) -> CrossEncoderReranker:
+    """Process-wide reranker instance, so the model is loaded once and the score cache is shared."""
+    return CrossEncoderReranker(
+        model_name=model_name,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        cache_size=cache_size
+    )
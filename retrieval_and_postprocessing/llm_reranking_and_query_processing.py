@@ -1,12 +1,12 @@
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
-from litellm import completion
-from tenacity import retry, wait_exponential
 
 # Your project utility imports
 from utils.logger import logging
 from utils.exception import CustomException
+from utils.llm_cache import LLMCache, make_cache_key
+from utils.llm_resilience import RetryPolicy, resilient_completion, aresilient_completion, record_fallback
 
 logger = logging.getLogger(__name__)
 
@@ -23,20 +23,34 @@ class RankOrder(BaseModel):
 
 # --- LOGIC FUNCTIONS ---
 
-@retry(wait=wait_exponential(multiplier=1, min=4, max=10))
-def rewrite_query(question: str, model: str, history: List[Dict] = []) -> str:
+_REWRITE_SYSTEM_MSG = (
+    "You are an expert ESG Auditor. Rewrite user questions into "
+    "precise search queries for a BRSR (Business Responsibility and Sustainability Report). "
+    "Expand technical terms (e.g., CSR, GHG, Scope 3) using BRSR and NGRBC-aligned language. "
+    "Keep the query concise. Respond ONLY with the refined query."
+)
+
+def rewrite_query(
+    question: str,
+    model: str,
+    history: List[Dict] = [],
+    cache: Optional[LLMCache] = None,
+    policy: Optional[RetryPolicy] = None
+) -> str:
     """
     Expert ESG Auditor rewriting logic.
     Expands queries with technical synonyms and regulatory frameworks (BRSR/NGRBC).
+    Rewrites are document-independent, so they are cached by (model, prompt) only.
     """
-    try:
-        system_msg = (
-            "You are an expert ESG Auditor. Rewrite user questions into "
-            "precise search queries for a BRSR (Business Responsibility and Sustainability Report). "
-            "Expand technical terms (e.g., CSR, GHG, Scope 3) using BRSR and NGRBC-aligned language. "
-            "Keep the query concise. Respond ONLY with the refined query."
-        )
+    system_msg = _REWRITE_SYSTEM_MSG
 
+    cache_key = make_cache_key(model, system_msg, question)
+    if cache is not None:
+        cached = cache.get("rewrite", cache_key)
+        if cached is not None:
+            return cached
+
+    try:
         # NOTE:
         # Conversation history is intentionally NOT used for query expansion.
         # Retrieval should remain intent-focused and evidence-driven.
@@ -44,29 +58,83 @@ def rewrite_query(question: str, model: str, history: List[Dict] = []) -> str:
 
         user_msg = question  # history intentionally ignored
 
-        response = completion(
+        response = resilient_completion(
             model=model,
             messages=[
                 {"role": "system", "content": system_msg},
                 {"role": "user", "content": user_msg}
-            ]
+            ],
+            policy=policy
         )
-        return response.choices[0].message.content.strip()
+        rewritten = response.choices[0].message.content.strip()
+
+        if cache is not None:
+            cache.set("rewrite", cache_key, rewritten)
+        return rewritten
 
     except Exception as e:
         logger.error(f"Query rewriting failed: {e}")
+        record_fallback("rewrite_query")
         return question  # Fallback to original
 
 
-@retry(wait=wait_exponential(multiplier=1, min=4, max=10))
-def rerank(question: str, chunks: List[Result], model: str) -> List[Result]:
+async def arewrite_query(
+    question: str,
+    model: str,
+    cache: Optional[LLMCache] = None,
+    policy: Optional[RetryPolicy] = None
+) -> str:
+    """Async (`aresilient_completion`) counterpart of `rewrite_query`, sharing its cache entries."""
+    cache_key = make_cache_key(model, _REWRITE_SYSTEM_MSG, question)
+    if cache is not None:
+        cached = cache.get("rewrite", cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        response = await aresilient_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": _REWRITE_SYSTEM_MSG},
+                {"role": "user", "content": question}
+            ],
+            policy=policy
+        )
+        rewritten = response.choices[0].message.content.strip()
+
+        if cache is not None:
+            cache.set("rewrite", cache_key, rewritten)
+        return rewritten
+
+    except Exception as e:
+        logger.error(f"Query rewriting failed: {e}")
+        record_fallback("rewrite_query")
+        return question
+
+
+def rerank(
+    question: str,
+    chunks: List[Result],
+    model: str,
+    cache: Optional[LLMCache] = None,
+    run_id: str = "",
+    policy: Optional[RetryPolicy] = None
+) -> List[Result]:
     """
     Senior Sustainability Auditor re-ranking logic.
     Prioritizes quantitative data, Principle-specific tables, and evidence over narrative.
+    Orderings are document-specific, so they are cached per run_id + candidate ids.
     """
     if not chunks:
         return []
 
+    candidate_ids = [c.metadata.get("chunk_id") or c.page_content for c in chunks]
+    cache_key = make_cache_key(model, run_id, question, candidate_ids)
+    if cache is not None:
+        cached_order = cache.get("rerank", cache_key)
+        if cached_order is not None:
+            return [chunks[i - 1] for i in cached_order if 0 < i <= len(chunks)]
+
     try:
         system_prompt = (
             "You are a Senior Sustainability Auditor. Rank document chunks "
@@ -89,19 +157,24 @@ def rerank(question: str, chunks: List[Result], model: str) -> List[Result]:
             {"role": "user", "content": user_prompt}
         ]
         
-        response = completion(
+        response = resilient_completion(
             model=model, 
             messages=messages, 
+            policy=policy,
             response_format=RankOrder
         )
         
         order = RankOrder.model_validate_json(response.choices[0].message.content).order
+
+        if cache is not None:
+            cache.set("rerank", cache_key, order)
         
         # Safe re-sorting (guarding against hallucinated IDs)
         return [chunks[i - 1] for i in order if 0 < i <= len(chunks)]
         
     except Exception as e:
         logger.warning(f"Reranking failed: {e}")
+        record_fallback("rerank")
         return chunks
 
 def merge_chunks(chunks_a: List[Result], chunks_b: List[Result]) -> List[Result]:
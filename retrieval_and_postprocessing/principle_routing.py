@@ -0,0 +1,79 @@
+# retrieval_and_postprocessing\principle_routing.py
+
+from typing import List, Dict, Optional
+
+# Your project utility imports
+from utils.logger import logging
+from vectorstore_ingestion.chunk_preprocessing import PRINCIPLE_MAP
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# BATCH -> BRSR SECTION ROUTING
+# =========================================================
+
+# Chunks that precede the first "PRINCIPLE n" header (Section A / Section B of
+# the BRSR, incl. the policy matrix and entity-level workforce counts).
+GENERAL_SECTION = "General Information"
+
+# Question batches from batched_question.jsonl -> BRSR sections they are answered from.
+BATCH_PRINCIPLE_MAP: Dict[str, List[str]] = {
+    "governance_policies": [GENERAL_SECTION, "1"],
+    "sourcing_circularity": ["2", "6"],
+    "environmental_metrics": ["6"],
+    "workforce_diversity": [GENERAL_SECTION, "3", "5"],
+    "employee_wellbeing_safety": ["3"],
+    "human_rights": ["5"],
+    "csr_community": [GENERAL_SECTION, "8"],
+    "stakeholder_engagement": ["4"],
+    "customer_responsibility": ["9"],
+}
+
+# Fallback for unknown batch names: question-id prefix -> BRSR principle.
+ID_PREFIX_PRINCIPLE_MAP: Dict[str, List[str]] = {
+    "GOV": [GENERAL_SECTION, "1"],
+    "SRC": ["2"],
+    "ENV": ["6"],
+    "WRK": ["3"],
+    "EWB": ["3"],
+    "HR": ["5"],
+    "CSR": ["8"],
+    "STK": ["4"],
+    "CST": ["9"],
+}
+
+
+def principle_label(section: str) -> str:
+    """Returns the exact `principle` metadata value written by chunk_preprocessing."""
+    if section == GENERAL_SECTION:
+        return GENERAL_SECTION
+    return f"Principle {section}: {PRINCIPLE_MAP.get(section, 'Unknown')}"
+
+
+def route_batch(batch_name: str, questions: List[Dict]) -> List[str]:
+    """
+    Maps a question batch to the `principle` metadata labels it should be searched in.
+    Returns an empty list when no route is known (caller should search globally).
+    """
+    sections = BATCH_PRINCIPLE_MAP.get(batch_name)
+
+    if sections is None:
+        sections = []
+        for q in questions:
+            prefix = q.get("id", "").split("_", 1)[0]
+            for s in ID_PREFIX_PRINCIPLE_MAP.get(prefix, []):
+                if s not in sections:
+                    sections.append(s)
+
+    labels = [principle_label(s) for s in sections]
+    logger.info(f"Routing batch [{batch_name}] to sections: {sections or 'GLOBAL'}")
+    return labels
+
+
+def build_where_filter(principles: Optional[List[str]]) -> Optional[Dict]:
+    """Builds a Chroma `where` clause restricting the search to the given principle labels."""
+    if not principles:
+        return None
+    if len(principles) == 1:
+        return {"principle": principles[0]}
+    return {"principle": {"$in": list(principles)}}
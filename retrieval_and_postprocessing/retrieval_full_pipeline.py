@@ -1,25 +1,45 @@
 # retrieval_and_postprocessing\retrieval_full_pipeline.py
 
 import sys
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from datetime import datetime
 
 # Component Imports
 from retrieval_and_postprocessing.retrieval_functions import RAGRetrievalEngine, Result
 from retrieval_and_postprocessing.llm_reranking_and_query_processing import (
     rewrite_query, 
+    arewrite_query,
     rerank, 
     merge_chunks
 )
+from retrieval_and_postprocessing.principle_routing import build_where_filter
 
 # Utility Imports
 from utils.logger import logging
 from utils.exception import CustomException
 from utils.read_yaml import read_yaml
+from utils.llm_cache import get_llm_cache
+from utils.llm_resilience import RetryPolicy
 
 logger = logging.getLogger(__name__)
 
+# Shared pool for speculative query rewrites (a late rewrite is abandoned, not awaited)
+_SPECULATIVE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rewrite")
+# Dedicated pool for the blocking local work of the async path (Chroma search, merge / rerank),
+# so it neither runs on the event loop nor competes with the default to_thread pool
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+async def _run_blocking(fn, *args):
+    """Runs `fn(*args)` on the retrieval pool, keeping context variables (metrics, cache scope)."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_SEARCH_EXECUTOR, ctx.run, fn, *args)
+
 class AdvancedRAGRetrievalEngine(RAGRetrievalEngine):
     """
     Extends base engine using centralized YAML configuration.
@@ -35,54 +55,245 @@ class AdvancedRAGRetrievalEngine(RAGRetrievalEngine):
             collection_name=self.config.vectorstore.collection_name,
             embedding_model=self.config.vectorstore.embedding_model
         )
+
+        # 3. Persistent cache for rewrites / rerank orderings (None when disabled)
+        self.llm_cache = get_llm_cache(self.config.get("cache"))
+        self.run_id = Path(db_path).parent.name
+
+        # 4. Retry budget / deadline / breaker thresholds for rewrite and rerank calls
+        self.llm_policy = RetryPolicy(**self.config.get("resilience", {}))
         logger.info("Advanced Engine initialized with YAML configuration.")
 
+    def fetch_context_routed(
+        self,
+        question: str,
+        n_results: int,
+        principles: Optional[List[str]] = None
+    ) -> List[Result]:
+        """
+        Searches only the chunks tagged with the given BRSR principles.
+        Falls back to a global search when the filtered recall looks too low.
+        """
+        return self._routed_search(self.embed_query(question), n_results, principles)
+
+    async def afetch_context_routed(
+        self,
+        question: str,
+        n_results: int,
+        principles: Optional[List[str]] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Result]:
+        """Async `fetch_context_routed`: awaits the embedding (unless given), runs the Chroma search on the retrieval pool."""
+        if query_vector is None:
+            query_vector = await self.aembed_query(question)
+        return await _run_blocking(self._routed_search, query_vector, n_results, principles)
+
+    def _routed_search(
+        self,
+        query_vector: List[float],
+        n_results: int,
+        principles: Optional[List[str]] = None
+    ) -> List[Result]:
+        """Principle-filtered search for a precomputed query vector, with the global-search fallback."""
+        routing = self.config.get("routing", {})
+        where = build_where_filter(principles) if routing.get("enabled", False) else None
+
+        if where is None:
+            return self.query_by_vector(query_vector, n_results=n_results)
+
+        chunks = self.query_by_vector(query_vector, n_results=n_results, where=where)
+
+        min_results = routing.get("min_filtered_results", n_results)
+        max_distance = routing.get("max_best_distance")
+        best_distance = chunks[0].metadata.get("distance") if chunks else None
+
+        low_count = len(chunks) < min_results
+        low_similarity = (
+            max_distance is not None
+            and best_distance is not None
+            and best_distance > max_distance
+        )
+
+        if low_count or low_similarity:
+            logger.info(
+                f"Routed search recall too low (hits={len(chunks)}, best_distance={best_distance}). "
+                "Falling back to global search."
+            )
+            return self.query_by_vector(query_vector, n_results=n_results)
+
+        return chunks
+
+    def rerank_candidates(self, question: str, chunks: List[Result]) -> List[Result]:
+        """
+        Dispatches to the configured reranker backend:
+        'llm' (listwise LLM prompt) or 'cross_encoder' (local CPU model).
+        """
+        cfg = self.config
+        backend = cfg.pipeline_logic.get("reranker_backend", "llm")
+
+        if backend == "cross_encoder":
+            # Imported lazily so torch is only loaded when this backend is enabled
+            from retrieval_and_postprocessing.cross_encoder_reranking import get_cross_encoder_reranker
+
+            rr_cfg = cfg.get("reranking", {})
+            reranker = get_cross_encoder_reranker(
+                cfg.models.get("cross_encoder_model", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                batch_size=rr_cfg.get("batch_size", 16),
+                max_workers=rr_cfg.get("max_workers", 2),
+                cache_size=rr_cfg.get("cache_size", 4096)
+            )
+            return reranker.rerank(question, chunks)
+
+        return rerank(
+            question,
+            chunks,
+            model=cfg.models.reranking_model,
+            cache=self.llm_cache,
+            run_id=self.run_id,
+            policy=self.llm_policy
+        )
+
+    def _merge_and_rank(
+        self,
+        question: str,
+        candidate_lists: List[List[Result]]
+    ) -> List[Result]:
+        """Merges per-query candidates, optionally reranks, and trims to final_k."""
+        cfg = self.config
+
+        # 2. Merging
+        all_candidate_chunks = []
+        for chunks in candidate_lists:
+            if not all_candidate_chunks:
+                all_candidate_chunks = chunks
+            else:
+                all_candidate_chunks = merge_chunks(all_candidate_chunks, chunks)
+
+        # 3. Reranking
+        if cfg.pipeline_logic.use_reranking:
+            logger.info(f"Reranking {len(all_candidate_chunks)} candidates...")
+            final_chunks = self.rerank_candidates(question, all_candidate_chunks)
+            return final_chunks[:cfg.retrieval.final_k]
+
+        # 4. Fallback
+        return all_candidate_chunks[:cfg.retrieval.final_k]
+
+    def _accept_rewrite(self, question: str, rewritten: Optional[str]) -> Optional[str]:
+        """Returns the rewritten query if it adds a distinct search, else None."""
+        if not rewritten or rewritten.strip() == question.strip():
+            return None
+        logger.info(f"Query Processed: {rewritten}")
+        return rewritten
+
     def get_context_advanced(
         self, 
         question: str, 
-        history: List[Dict] = []
+        history: List[Dict] = [],
+        principles: Optional[List[str]] = None
     ) -> Tuple[List[Result], str]:
         """
         Retrieves context based on parameters defined in the master config.
+        `principles` optionally restricts the search to those BRSR sections (see principle_routing).
+
+        The query rewrite runs speculatively alongside retrieval for the original question and
+        is bounded by `retrieval.rewrite_budget_seconds`; a late rewrite is dropped.
         """
         try:
             cfg = self.config  # For cleaner access
-            
-            # 1. Query Processing
-            target_queries = [question]
+            n_results = cfg.retrieval.initial_k
+            budget = cfg.retrieval.get("rewrite_budget_seconds")
             expanded_query_display = "N/A (Original only)"
-            
+
+            # 1. Query Processing (started first, runs in the background)
+            rewrite_future = None
+            started = time.monotonic()
             if cfg.pipeline_logic.process_query:
-                rewritten = rewrite_query(
-                    question, 
-                    model=cfg.models.query_expansion_model, 
-                    history=history
+                # copy_context keeps run-scoped state (e.g. completion cache) in the worker thread
+                rewrite_future = _SPECULATIVE_EXECUTOR.submit(
+                    contextvars.copy_context().run,
+                    rewrite_query,
+                    question,
+                    model=cfg.models.query_expansion_model,
+                    history=history,
+                    cache=self.llm_cache,
+                    policy=self.llm_policy
                 )
-                target_queries.append(rewritten)
-                expanded_query_display = rewritten
-                logger.info(f"Query Processed: {rewritten}")
-
-            # 2. Dual Retrieval & Merging
-            all_candidate_chunks = []
-            for q in target_queries:
-                chunks = self.fetch_context_unranked(q, n_results=cfg.retrieval.initial_k)
-                if not all_candidate_chunks:
-                    all_candidate_chunks = chunks
-                else:
-                    all_candidate_chunks = merge_chunks(all_candidate_chunks, chunks)
-            
-            # 3. Reranking
-            if cfg.pipeline_logic.use_reranking:
-                logger.info(f"Reranking {len(all_candidate_chunks)} candidates...")
-                final_chunks = rerank(
-                    question, 
-                    all_candidate_chunks, 
-                    model=cfg.models.reranking_model
+
+            # 2. Original-query retrieval overlaps the rewrite
+            candidate_lists = [
+                self.fetch_context_routed(question, n_results=n_results, principles=principles)
+            ]
+
+            if rewrite_future is not None:
+                remaining = None if budget is None else max(0.0, budget - (time.monotonic() - started))
+                try:
+                    rewritten = self._accept_rewrite(question, rewrite_future.result(timeout=remaining))
+                except FuturesTimeoutError:
+                    logger.warning(f"Query rewrite exceeded {budget}s budget. Using original results only.")
+                    rewritten = None
+
+                if rewritten:
+                    expanded_query_display = rewritten
+                    candidate_lists.append(
+                        self.fetch_context_routed(rewritten, n_results=n_results, principles=principles)
+                    )
+
+            return self._merge_and_rank(question, candidate_lists), expanded_query_display
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    async def aget_context_advanced(
+        self,
+        question: str,
+        history: List[Dict] = [],
+        principles: Optional[List[str]] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Result], str]:
+        """
+        Async variant of `get_context_advanced`: original retrieval and query rewrite are
+        launched together; the rewrite is awaited only up to `retrieval.rewrite_budget_seconds`.
+        Embeddings and the rewrite use async clients; Chroma search and reranking run on a dedicated pool.
+        `query_vector` reuses an embedding of `question` the caller already has.
+        """
+        try:
+            cfg = self.config
+            n_results = cfg.retrieval.initial_k
+            budget = cfg.retrieval.get("rewrite_budget_seconds")
+            expanded_query_display = "N/A (Original only)"
+
+            original_task = asyncio.create_task(
+                self.afetch_context_routed(question, n_results, principles, query_vector)
+            )
+
+            rewritten = None
+            if cfg.pipeline_logic.process_query:
+                rewrite_task = asyncio.create_task(
+                    arewrite_query(
+                        question,
+                        model=cfg.models.query_expansion_model,
+                        cache=self.llm_cache,
+                        policy=self.llm_policy
+                    )
                 )
-                return final_chunks[:cfg.retrieval.final_k], expanded_query_display
-            
-            # 4. Fallback
-            return all_candidate_chunks[:cfg.retrieval.final_k], expanded_query_display
+                try:
+                    rewritten = self._accept_rewrite(
+                        question, await asyncio.wait_for(rewrite_task, timeout=budget)
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"Query rewrite exceeded {budget}s budget. Using original results only.")
+
+            if rewritten:
+                expanded_query_display = rewritten
+                candidate_lists = list(await asyncio.gather(
+                    original_task,
+                    self.afetch_context_routed(rewritten, n_results, principles)
+                ))
+            else:
+                candidate_lists = [await original_task]
+
+            final_chunks = await _run_blocking(self._merge_and_rank, question, candidate_lists)
+            return final_chunks, expanded_query_display
 
         except Exception as e:
             raise CustomException(e, sys)
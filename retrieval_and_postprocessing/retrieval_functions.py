@@ -2,20 +2,23 @@
 
 import sys
 import json
+import asyncio
+import weakref
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from chromadb import PersistentClient
-from litellm import completion
 from pydantic import BaseModel, Field
-from tenacity import retry, wait_exponential
+from tenacity import wait_exponential
 from dotenv import load_dotenv
 
 # Your project utility imports
 from utils.logger import logging
 from utils.exception import CustomException
+from utils.llm_resilience import resilient_completion, scoped_cache_get, scoped_cache_set
+from utils.run_metrics import record_embedding_call
 
 load_dotenv(override=True)
 logger = logging.getLogger(__name__)
@@ -31,6 +34,18 @@ class RankOrder(BaseModel):
         description="The order of relevance of chunks, from most relevant to least relevant, by chunk id number"
     )
 
+# --- SHARED CLIENTS ---
+
+_ASYNC_OPENAI_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """One AsyncOpenAI client (and connection pool) per event loop, built on first use and shared by all engines."""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_OPENAI_CLIENTS.get(loop)
+    if client is None:
+        client = _ASYNC_OPENAI_CLIENTS[loop] = AsyncOpenAI()
+    return client
+
 # --- CORE ENGINE ---
 
 class RAGRetrievalEngine:
@@ -41,6 +56,7 @@ class RAGRetrievalEngine:
         
         # Initialize Clients
         self.openai_client = OpenAI()
+        self._async_openai_client: Optional[AsyncOpenAI] = None  # shared per event loop unless set
         self.chroma_client = PersistentClient(path=str(db_path))
         
         try:
@@ -53,36 +69,104 @@ class RAGRetrievalEngine:
         # Retry logic for API calls
         self.wait_strategy = wait_exponential(multiplier=1, min=4, max=10)
 
+    @property
+    def async_openai_client(self) -> AsyncOpenAI:
+        return self._async_openai_client or get_async_openai_client()
+
+    @async_openai_client.setter
+    def async_openai_client(self, client: AsyncOpenAI):
+        self._async_openai_client = client
+
     def _get_safe_source(self, metadata: Dict) -> str:
         """Helper to handle inconsistent naming in metadata (source vs source_file)."""
         return metadata.get('source') or metadata.get('source_file') or "Unknown Source"
 
-    def fetch_context_unranked(self, question: str, n_results: int = 20) -> List[Result]:
-        """Performs raw vector search against the ChromaDB."""
+    def embed_query(self, question: str) -> List[float]:
+        """Embeds a single query string with the configured embedding model."""
         try:
-            # 1. Embed the query
+            # Served from the run-scoped response cache when one is active
+            cached, cache_key = scoped_cache_get(self.embedding_model, "embedding", question)
+            if cached is not None:
+                record_embedding_call(self.embedding_model, cached=True)
+                return cached
+
             response = self.openai_client.embeddings.create(
                 model=self.embedding_model, 
                 input=[question]
             )
-            query_vector = response.data[0].embedding
+            record_embedding_call(self.embedding_model, response)
+            vector = response.data[0].embedding
+            scoped_cache_set(cache_key, vector)
+            return vector
+        except Exception as e:
+            raise CustomException(e, sys)
 
-            # 2. Query Vectorstore
-            results = self.collection.query(
-                query_embeddings=[query_vector], 
-                n_results=n_results
+    async def aembed_query(self, question: str) -> List[float]:
+        """Async counterpart of `embed_query` (same cache scope and metrics)."""
+        try:
+            cached, cache_key = scoped_cache_get(self.embedding_model, "embedding", question)
+            if cached is not None:
+                record_embedding_call(self.embedding_model, cached=True)
+                return cached
+
+            response = await self.async_openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=[question]
             )
+            record_embedding_call(self.embedding_model, response)
+            vector = response.data[0].embedding
+            scoped_cache_set(cache_key, vector)
+            return vector
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def query_by_vector(
+        self,
+        query_vector: List[float],
+        n_results: int = 20,
+        where: Optional[Dict] = None
+    ) -> List[Result]:
+        """Queries the ChromaDB with a precomputed vector and optional metadata filter."""
+        try:
+            query_kwargs = {"query_embeddings": [query_vector], "n_results": n_results}
+            if where:
+                query_kwargs["where"] = where
 
-            # 3. Format as Pydantic models
+            results = self.collection.query(**query_kwargs)
+
+            # Format as Pydantic models (chunk id + distance kept for routing/reranking)
             formatted_results = []
-            for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
+            for chunk_id, doc, meta, dist in zip(
+                results["ids"][0],
+                results["documents"][0],
+                results["metadatas"][0],
+                results["distances"][0],
+            ):
+                meta = dict(meta or {})
+                meta["chunk_id"] = chunk_id
+                meta["distance"] = dist
                 formatted_results.append(Result(page_content=doc, metadata=meta))
             
             return formatted_results
         except Exception as e:
             raise CustomException(e, sys)
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=10))
+    def fetch_context_unranked(
+        self,
+        question: str,
+        n_results: int = 20,
+        where: Optional[Dict] = None
+    ) -> List[Result]:
+        """Performs raw vector search against the ChromaDB."""
+        try:
+            # 1. Embed the query
+            query_vector = self.embed_query(question)
+
+            # 2. Query Vectorstore
+            return self.query_by_vector(query_vector, n_results=n_results, where=where)
+        except Exception as e:
+            raise CustomException(e, sys)
+
     def rewrite_query(self, question: str, history: List[Dict] = []) -> str:
         """Rewrites user query to be more specific for Knowledge Base search."""
         message = f"""
@@ -92,7 +176,7 @@ class RAGRetrievalEngine:
         History: {history}
         Respond ONLY with the refined query text.
         """
-        response = completion(
+        response = resilient_completion(
             model="gpt-4.1-nano", 
             messages=[{"role": "user", "content": message}]
         )
@@ -0,0 +1,384 @@
+import json
+import math
+import time
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Run status reported by the API for the latest job of a run, per job type and job status
+RUN_STATUS = {
+    "ingest": {"queued": "queued", "running": "ingesting", "completed": "ready", "failed": "failed_ingestion"},
+    "report": {"queued": "report_queued", "running": "generating_report", "completed": "completed", "failed": "failed_report"},
+}
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is refused admission; `retry_after` is a suggested wait in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class JobConflictError(Exception):
+    """Raised when a job cannot be queued in the current state of its run's other jobs."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class JobStore:
+    """
+    Durable SQLite job queue and state shared by every API and worker process.
+    Workers claim queued jobs atomically and heartbeat while running; a job whose
+    heartbeat goes stale (worker crashed or was killed) is re-queued up to `max_attempts`.
+    """
+
+    def __init__(self, db_path: Path, max_attempts: int = 2):
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " run_id TEXT NOT NULL,"
+                " job_type TEXT NOT NULL,"
+                " client TEXT,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " worker TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " heartbeat_at REAL,"
+                " finished_at REAL)"
+            )
+            # Stores created before admission control have no client column
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "client" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN client TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, job_type, job_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_client ON jobs (client, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_run ON jobs (run_id, job_id)")
+
+    @contextmanager
+    def _connect(self):
+        # Short-lived connections; BEGIN IMMEDIATE in `claim` serialises competing workers
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _as_job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    # --- PRODUCERS (API) ---
+
+    def enqueue(
+        self,
+        run_id: str,
+        job_type: str,
+        payload: Dict[str, Any],
+        client: Optional[str] = None,
+        max_queued: Optional[int] = None,
+        max_per_client: Optional[int] = None,
+        after: Optional[str] = None,
+        exclusive: bool = False
+    ) -> int:
+        """
+        Queues a job and returns its id. The limits are checked in the same transaction as the insert:
+        at most `max_queued` waiting jobs of this type and `max_per_client` queued or running jobs per client.
+        Raises QueueFullError (retry_after=0, filled in by the caller) when a limit is reached.
+        With `after`, the run's latest job of that type must be completed; with `exclusive`, the run
+        must have no queued or running job of this type. Raises JobConflictError otherwise.
+        """
+        if job_type not in RUN_STATUS:
+            raise ValueError(f"Unknown job type: {job_type}")
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if after:
+                    row = conn.execute(
+                        "SELECT status FROM jobs WHERE run_id = ? AND job_type = ? ORDER BY job_id DESC LIMIT 1",
+                        (run_id, after)
+                    ).fetchone()
+                    if row is None:
+                        raise JobConflictError(f"no {after} job recorded for this run")
+                    if row["status"] != "completed":
+                        raise JobConflictError(f"{after} job for this run is {row['status']}, not completed")
+                if exclusive:
+                    row = conn.execute(
+                        "SELECT job_id FROM jobs WHERE run_id = ? AND job_type = ? AND status IN ('queued', 'running') "
+                        "LIMIT 1",
+                        (run_id, job_type)
+                    ).fetchone()
+                    if row is not None:
+                        raise JobConflictError(f"a {job_type} job is already active for this run (job {row['job_id']})")
+                if max_queued:
+                    queued = conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND job_type = ?", (job_type,)
+                    ).fetchone()[0]
+                    if queued >= max_queued:
+                        raise QueueFullError(f"{job_type} queue is full ({queued} waiting)", 0)
+                if max_per_client and client is not None:
+                    active = conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN ('queued', 'running')", (client,)
+                    ).fetchone()[0]
+                    if active >= max_per_client:
+                        raise QueueFullError(f"client already has {active} active jobs", 0)
+
+                cursor = conn.execute(
+                    "INSERT INTO jobs (run_id, job_type, client, payload, status, created_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (run_id, job_type, client, json.dumps(payload, default=str), time.time())
+                )
+                job_id = cursor.lastrowid
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Queued {job_type} job {job_id} for run {run_id}")
+        return job_id
+
+    # --- CONSUMERS (workers) ---
+
+    def claim(self, job_types: List[str], worker: str, fair_share: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Atomically moves the next queued job of the given types to 'running' and returns it.
+        FIFO by default; with `fair_share`, jobs of clients with the fewest running jobs go first.
+        """
+        placeholders = ", ".join("?" for _ in job_types)
+        order = (
+            "(SELECT COUNT(*) FROM jobs r WHERE r.status = 'running' AND r.client IS j.client), j.job_id"
+            if fair_share else "j.job_id"
+        )
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT j.job_id FROM jobs j WHERE j.status = 'queued' AND j.job_type IN ({placeholders}) "
+                    f"ORDER BY {order} LIMIT 1",
+                    job_types
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, error = NULL, "
+                    " started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                    (worker, now, now, row["job_id"])
+                )
+                job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self._as_job(job)
+
+    def heartbeat(self, job_id: int):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id))
+
+    def finish(self, job_id: int, error: Optional[str] = None):
+        """Marks a running job completed, or failed with `error`."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                ("failed" if error else "completed", error, time.time(), job_id)
+            )
+
+    def requeue_stale(self, stale_after_seconds: float) -> int:
+        """Re-queues running jobs without a recent heartbeat (failing those out of attempts)."""
+        cutoff = time.time() - stale_after_seconds
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost', finished_at = ? "
+                    "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                    (time.time(), cutoff, self.max_attempts)
+                ).rowcount
+                requeued = conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                    (cutoff,)
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if failed or requeued:
+            logger.warning(f"Stale jobs: {requeued} re-queued, {failed} failed after {self.max_attempts} attempts")
+        return requeued
+
+    # --- READERS ---
+
+    def latest_job(self, run_id: str, job_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            if job_type is None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE run_id = ? ORDER BY job_id DESC LIMIT 1", (run_id,)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE run_id = ? AND job_type = ? ORDER BY job_id DESC LIMIT 1",
+                    (run_id, job_type)
+                ).fetchone()
+        return self._as_job(row)
+
+    def queue_position(self, job: Dict[str, Any], fair_share: bool = False) -> Optional[int]:
+        """
+        1-based position of a queued job among waiting jobs of its type (None once it has started),
+        in the order `claim` would pick them now: FIFO, or fewest running jobs per client first with `fair_share`.
+        """
+        if job["status"] != "queued":
+            return None
+        with self._connect() as conn:
+            if not fair_share:
+                ahead = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND job_type = ? AND job_id < ?",
+                    (job["job_type"], job["job_id"])
+                ).fetchone()[0]
+            else:
+                ahead = conn.execute(
+                    "WITH q AS ("
+                    " SELECT j.job_id, (SELECT COUNT(*) FROM jobs r WHERE r.status = 'running' AND r.client IS j.client) AS load"
+                    " FROM jobs j WHERE j.status = 'queued' AND j.job_type = ?) "
+                    "SELECT COUNT(*) FROM q, (SELECT load FROM q WHERE job_id = ?) me "
+                    "WHERE q.load < me.load OR (q.load = me.load AND q.job_id < ?)",
+                    (job["job_type"], job["job_id"], job["job_id"])
+                ).fetchone()[0]
+        return ahead + 1
+
+    def mean_duration(self, job_type: str, last_n: int = 20) -> Optional[float]:
+        """Mean run time in seconds of the last `last_n` completed jobs of a type."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM jobs "
+                " WHERE job_type = ? AND status = 'completed' ORDER BY job_id DESC LIMIT ?)",
+                (job_type, last_n)
+            ).fetchone()
+        return row[0]
+
+    def run_status(self, run_id: str) -> str:
+        """API status of a run from its latest job ('not_found' when the run has no jobs)."""
+        job = self.latest_job(run_id)
+        if job is None:
+            return "not_found"
+        return RUN_STATUS[job["job_type"]][job["status"]]
+
+    def is_active(self, run_id: str, job_type: Optional[str] = None) -> bool:
+        job = self.latest_job(run_id, job_type)
+        return job is not None and job["status"] in ACTIVE_STATUSES
+
+    def active_for_client(self, client: str) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN ('queued', 'running')", (client,)
+            ).fetchone()[0]
+
+    def forget_run(self, run_id: str):
+        """Drops the job history of a deleted run."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Job counts per type and status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_type, status, COUNT(*) AS n FROM jobs GROUP BY job_type, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row["job_type"], {})[row["status"]] = row["n"]
+        return counts
+
+
+class AdmissionController:
+    """
+    Admission control in front of the job store: the worker count per job type caps concurrency,
+    a bounded wait queue per type and an optional per-client cap apply backpressure, and
+    rejected requests get a Retry-After estimate from recent job durations.
+    """
+
+    def __init__(self, store: JobStore, job_cfg: Dict[str, Any]):
+        self.store = store
+        self.workers = dict(job_cfg.get("workers", {}))
+        admission = job_cfg.get("admission", {}) or {}
+        self.max_queued = dict(admission.get("max_queued", {}))
+        self.max_per_client = admission.get("max_active_per_client") or None
+        self.fair_share = bool(admission.get("fair_share", False))
+        self.default_retry_after = int(admission.get("default_retry_after_seconds", 30))
+
+    def retry_after(self, job_type: str) -> int:
+        """Expected seconds until a worker of this type frees up."""
+        mean = self.store.mean_duration(job_type)
+        if mean is None:
+            return self.default_retry_after
+        return max(1, math.ceil(mean / max(1, int(self.workers.get(job_type, 1)))))
+
+    def check(self, job_type: str, client: Optional[str] = None):
+        """Cheap pre-check (e.g. before accepting an upload); `admit` re-checks atomically."""
+        max_queued = self.max_queued.get(job_type)
+        if max_queued and self.store.counts().get(job_type, {}).get("queued", 0) >= max_queued:
+            raise QueueFullError(f"{job_type} queue is full", self.retry_after(job_type))
+        if self.max_per_client and client is not None and self.store.active_for_client(client) >= self.max_per_client:
+            raise QueueFullError("client has too many active jobs", self.retry_after(job_type))
+
+    def admit(
+        self,
+        run_id: str,
+        job_type: str,
+        payload: Dict[str, Any],
+        client: Optional[str] = None,
+        after: Optional[str] = None,
+        exclusive: bool = False
+    ) -> int:
+        """
+        Queues the job or raises QueueFullError with a Retry-After estimate
+        (JobConflictError for unmet `after` / `exclusive` preconditions, see `JobStore.enqueue`).
+        """
+        try:
+            return self.store.enqueue(
+                run_id, job_type, payload,
+                client=client if self.max_per_client or self.fair_share else None,
+                max_queued=self.max_queued.get(job_type),
+                max_per_client=self.max_per_client,
+                after=after,
+                exclusive=exclusive
+            )
+        except QueueFullError as e:
+            logger.warning(f"Rejected {job_type} job for run {run_id} (client {client}): {e.reason}")
+            raise QueueFullError(e.reason, self.retry_after(job_type))
+
+
+@lru_cache(maxsize=4)
+def _store_instance(db_path: str, max_attempts: int) -> JobStore:
+    return JobStore(Path(db_path), max_attempts=max_attempts)
+
+
+def get_job_store(store_cfg: Optional[Dict]) -> JobStore:
+    """Builds (once per process) the job store described by a `store` config block."""
+    store_cfg = store_cfg or {}
+    return _store_instance(
+        str(store_cfg.get("path", "jobs/jobs.sqlite")),
+        int(store_cfg.get("max_attempts", 2))
+    )
@@ -0,0 +1,157 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, *parts: Any) -> str:
+    """Stable SHA-256 key over the model name and the prompt-defining parts."""
+    payload = json.dumps([model, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Disk-backed (SQLite) LRU cache for LLM outputs.
+    Entries live in namespaces (e.g. 'rewrite', 'rerank'), expire after `ttl_hours`
+    and each namespace is trimmed to `max_entries` by least-recent access.
+    """
+
+    def __init__(self, db_path: Path, ttl_hours: float = 168, max_entries: int = 20000):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_lru ON llm_cache (namespace, accessed_at)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps the cache safe across threads and processes
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, namespace: str, field: str):
+        with self._lock:
+            ns = self._counters.setdefault(namespace, {"hits": 0, "misses": 0})
+            ns[field] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Returns the cached (JSON-decoded) value, or None on miss/expiry."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+
+                if row is None or (now - row[1]) > self.ttl_seconds:
+                    if row is not None:
+                        conn.execute(
+                            "DELETE FROM llm_cache WHERE namespace = ? AND key = ?", (namespace, key)
+                        )
+                    self._count(namespace, "misses")
+                    return None
+
+                conn.execute(
+                    "UPDATE llm_cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key)
+                )
+            self._count(namespace, "hits")
+            return json.loads(row[0])
+
+        except Exception as e:
+            logger.warning(f"LLM cache read failed ({namespace}): {e}")
+            self._count(namespace, "misses")
+            return None
+
+    def set(self, namespace: str, key: str, value: Any):
+        """Stores a JSON-serialisable value and evicts the least recently used overflow."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (namespace, key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE namespace = ? AND created_at < ?",
+                    (namespace, now - self.ttl_seconds)
+                )
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE namespace = ? AND key NOT IN ("
+                    " SELECT key FROM llm_cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT ?)",
+                    (namespace, namespace, self.max_entries)
+                )
+        except Exception as e:
+            logger.warning(f"LLM cache write failed ({namespace}): {e}")
+
+    def clear_namespace(self, namespace: str):
+        """Drops every entry in a namespace (e.g. when its run is deleted)."""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_cache WHERE namespace = ?", (namespace,))
+        except Exception as e:
+            logger.warning(f"LLM cache clear failed ({namespace}): {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters per namespace for this process."""
+        with self._lock:
+            return {ns: dict(c) for ns, c in self._counters.items()}
+
+    def stats_since(self, baseline: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters per namespace accumulated since `baseline` (an earlier `stats()`)."""
+        delta = {}
+        for ns, counts in self.stats().items():
+            before = baseline.get(ns, {})
+            diff = {field: value - before.get(field, 0) for field, value in counts.items()}
+            if any(diff.values()):
+                delta[ns] = diff
+        return delta
+
+
+@lru_cache(maxsize=8)
+def _cache_instance(db_path: str, ttl_hours: float, max_entries: int) -> LLMCache:
+    return LLMCache(Path(db_path), ttl_hours=ttl_hours, max_entries=max_entries)
+
+
+def get_llm_cache(cache_cfg: Optional[Dict]) -> Optional[LLMCache]:
+    """Builds (once per process) the cache described by a `cache` config block, if enabled."""
+    if not cache_cfg or not cache_cfg.get("enabled", False):
+        return None
+    return _cache_instance(
+        str(cache_cfg.get("path", "cache/llm_cache.sqlite")),
+        float(cache_cfg.get("ttl_hours", 168)),
+        int(cache_cfg.get("max_entries", 20000))
+    )
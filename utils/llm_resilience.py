@@ -0,0 +1,400 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from litellm import completion, acompletion, ModelResponse
+from litellm.exceptions import (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+)
+from pydantic import BaseModel
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_exponential,
+)
+
+from utils.logger import logging
+from utils.llm_cache import LLMCache, make_cache_key
+from utils.run_metrics import record_llm_call, record_metric
+
+logger = logging.getLogger(__name__)
+
+# --- DATA MODELS ---
+
+class RetryPolicy(BaseModel):
+    """Retry budget, deadline and breaker thresholds for a family of LLM calls."""
+    max_attempts: int = 3
+    deadline_seconds: float = 60.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 60.0
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while a model's circuit breaker is open."""
+
+
+# Provider errors worth retrying and counting against the breaker; auth, bad-request and
+# context-window errors fail fast instead (retrying cannot fix them).
+_TRANSIENT_ERRORS = (
+    RateLimitError, Timeout, APIConnectionError, InternalServerError, ServiceUnavailableError,
+    TimeoutError, ConnectionError,
+)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Rate limits, timeouts, connection failures and 5xx responses."""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+# --- CIRCUIT BREAKER ---
+
+class CircuitBreaker:
+    """
+    Per-model breaker: opens after `failure_threshold` consecutive transient failures,
+    rejects calls for `reset_seconds`, then admits a single probe call (half-open) whose
+    outcome closes or re-opens it. A probe that never reports back expires after `reset_seconds`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.opens = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and (
+                self.probe_started is None or now - self.probe_started >= self.reset_seconds
+            ):
+                self.probe_started = now
+                return True
+
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Ends a probe without a verdict (the call failed for a non-transient reason)."""
+        with self._lock:
+            self.probe_started = None
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                    logger.warning(f"Circuit breaker OPEN for model '{self.name}' after {self.failures} failures.")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "opens": self.opens, "rejected": self.rejected}
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_breaker(model: str, policy: Optional[RetryPolicy] = None) -> CircuitBreaker:
+    """Process-wide breaker for a model (thresholds taken from the first policy that creates it)."""
+    policy = policy or RetryPolicy()
+    with _REGISTRY_LOCK:
+        if model not in _BREAKERS:
+            _BREAKERS[model] = CircuitBreaker(
+                model,
+                failure_threshold=policy.breaker_failure_threshold,
+                reset_seconds=policy.breaker_reset_seconds
+            )
+        return _BREAKERS[model]
+
+
+# --- RATE LIMITING ---
+
+class AsyncRateLimiter:
+    """Spaces call starts to at most `requests_per_minute` (None/0 disables the limit)."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# --- METRICS ---
+
+def record_fallback(name: str):
+    """Counts a degraded (non-LLM) fallback taken by a helper function in the active run's metrics."""
+    record_metric(fallbacks=1, **{f"fallback_{name}": 1})
+
+
+def resilience_stats() -> Dict[str, Any]:
+    """
+    Current breaker state per model. Breakers are shared by every run in the process, so only
+    their state is reported; fallbacks are counted per run by `record_fallback`.
+    """
+    with _REGISTRY_LOCK:
+        breakers = dict(_BREAKERS)
+    states = {name: b.snapshot()["state"] for name, b in breakers.items()}
+    return {
+        "breakers": states,
+        "open_breakers": [name for name, state in states.items() if state == "open"],
+    }
+
+
+# --- RESPONSE CACHE (opt-in, per run) ---
+
+_COMPLETION_CACHE: ContextVar[Optional[Tuple[LLMCache, str]]] = ContextVar("completion_cache", default=None)
+
+
+@contextmanager
+def completion_cache_scope(cache: Optional[LLMCache], namespace: str):
+    """
+    Serves every resilient_completion / aresilient_completion call made inside this block
+    (incl. asyncio tasks and to_thread workers) from `cache` under `namespace`.
+    A None cache leaves caching off.
+    """
+    token = _COMPLETION_CACHE.set((cache, namespace) if cache is not None else None)
+    try:
+        yield
+    finally:
+        _COMPLETION_CACHE.reset(token)
+
+
+def _cacheable_params(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    params = {}
+    for k, v in kwargs.items():
+        if isinstance(v, type) and issubclass(v, BaseModel):
+            v = v.model_json_schema()
+        params[k] = v
+    return params
+
+
+def scoped_cache_get(model: str, *parts: Any) -> Tuple[Optional[Any], Optional[str]]:
+    """Looks up (model, parts) in the active run scope; returns (value, key) or (None, None) when off."""
+    scope = _COMPLETION_CACHE.get()
+    if scope is None:
+        return None, None
+    cache, namespace = scope
+    key = make_cache_key(model, *parts)
+    return cache.get(namespace, key), key
+
+
+def scoped_cache_set(key: Optional[str], value: Any):
+    """Stores a JSON-serialisable value under a key returned by `scoped_cache_get`."""
+    scope = _COMPLETION_CACHE.get()
+    if scope is None or key is None:
+        return
+    cache, namespace = scope
+    cache.set(namespace, key, value)
+
+
+def _cache_lookup(model: str, messages: List[Dict], kwargs: Dict[str, Any]):
+    cached, key = scoped_cache_get(model, messages, _cacheable_params(kwargs))
+    return (ModelResponse(**cached) if cached is not None else None), key
+
+
+def _cache_store(key: Optional[str], response):
+    if key is not None:
+        scoped_cache_set(key, response.model_dump())
+
+
+# --- RESILIENT CALLS ---
+
+def _retry_kwargs(policy: RetryPolicy) -> Dict[str, Any]:
+    return dict(
+        stop=stop_after_attempt(policy.max_attempts) | stop_after_delay(policy.deadline_seconds),
+        wait=wait_exponential(multiplier=1, min=1, max=10),
+        retry=retry_if_exception(is_transient_error),
+        reraise=True
+    )
+
+
+def _record_error(breaker: CircuitBreaker, error: BaseException):
+    if is_transient_error(error):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+def _remaining(policy: RetryPolicy, started: float) -> float:
+    return max(1.0, policy.deadline_seconds - (time.monotonic() - started))
+
+
+def resilient_completion(
+    model: str,
+    messages: List[Dict],
+    policy: Optional[RetryPolicy] = None,
+    **kwargs
+):
+    """
+    litellm `completion` with a bounded retry budget, an overall deadline and a per-model
+    circuit breaker. Only transient errors are retried and counted by the breaker. Raises the
+    last error (or CircuitOpenError) once the budget is spent, so callers can take their
+    non-LLM fallback path.
+    Inside a `completion_cache_scope` identical calls are served from the response cache.
+    """
+    cached, cache_key = _cache_lookup(model, messages, kwargs)
+    if cached is not None:
+        record_llm_call(model, cached, cached=True)
+        return cached
+
+    policy = policy or RetryPolicy()
+    breaker = get_breaker(model, policy)
+    started = time.monotonic()
+
+    for attempt in Retrying(**_retry_kwargs(policy)):
+        with attempt:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for model '{model}'")
+
+            try:
+                response = completion(
+                    model=model, messages=messages, timeout=_remaining(policy, started), **kwargs
+                )
+            except Exception as e:
+                _record_error(breaker, e)
+                raise
+
+            breaker.record_success()
+            record_llm_call(model, response)
+            _cache_store(cache_key, response)
+            return response
+
+
+async def aresilient_completion(
+    model: str,
+    messages: List[Dict],
+    policy: Optional[RetryPolicy] = None,
+    **kwargs
+):
+    """Async (`acompletion`) counterpart of `resilient_completion` with the same guarantees."""
+    cached, cache_key = _cache_lookup(model, messages, kwargs)
+    if cached is not None:
+        record_llm_call(model, cached, cached=True)
+        return cached
+
+    policy = policy or RetryPolicy()
+    breaker = get_breaker(model, policy)
+    started = time.monotonic()
+
+    async for attempt in AsyncRetrying(**_retry_kwargs(policy)):
+        with attempt:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for model '{model}'")
+
+            try:
+                response = await acompletion(
+                    model=model, messages=messages, timeout=_remaining(policy, started), **kwargs
+                )
+            except Exception as e:
+                _record_error(breaker, e)
+                raise
+
+            breaker.record_success()
+            record_llm_call(model, response)
+            _cache_store(cache_key, response)
+            return response
+
+
+def _delta_text(chunk) -> str:
+    choices = getattr(chunk, "choices", None) or []
+    delta = getattr(choices[0], "delta", None) if choices else None
+    return (getattr(delta, "content", None) or "") if delta is not None else ""
+
+
+async def aresilient_stream(
+    model: str,
+    messages: List[Dict],
+    policy: Optional[RetryPolicy] = None,
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Streaming `acompletion` yielding text deltas. Opening the stream (up to its first chunk)
+    follows the retry budget, deadline and circuit breaker of `aresilient_completion`; once
+    tokens have been yielded a failure is raised as-is. Streams bypass the completion cache.
+    Usage is requested with the stream (`stream_options.include_usage`) and recorded from the
+    chunk that carries it once the stream ends.
+    """
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    policy = policy or RetryPolicy()
+    breaker = get_breaker(model, policy)
+    started = time.monotonic()
+
+    stream, first = None, None
+    async for attempt in AsyncRetrying(**_retry_kwargs(policy)):
+        with attempt:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for model '{model}'")
+
+            try:
+                stream = await acompletion(
+                    model=model, messages=messages, stream=True, timeout=_remaining(policy, started), **kwargs
+                )
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                _record_error(breaker, e)
+                raise
+
+    usage_chunk = None
+    try:
+        if first is not None:
+            usage_chunk = first if getattr(first, "usage", None) else None
+            text = _delta_text(first)
+            if text:
+                yield text
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage_chunk = chunk
+                text = _delta_text(chunk)
+                if text:
+                    yield text
+    except Exception as e:
+        _record_error(breaker, e)
+        raise
+    breaker.record_success()
+    record_llm_call(model, usage_chunk)
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 import os
 
 logs_path = os.path.join(os.getcwd(), "logs")
@@ -6,7 +7,9 @@ os.makedirs(logs_path, exist_ok=True)
 
 LOG_FILE_PATH = os.path.join(logs_path, "running_log.log")
 
-if os.path.exists(LOG_FILE_PATH):
+# Fresh log per start of the top-level process only; spawned job workers and
+# report-build processes import this module too and append to the same file
+if multiprocessing.parent_process() is None and os.path.exists(LOG_FILE_PATH):
     with open(LOG_FILE_PATH, "w") as f:
         f.truncate(0)
 
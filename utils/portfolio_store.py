@@ -0,0 +1,228 @@
+import re
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Filters and group-by keys the query API accepts (column names are never taken from user input)
+FILTER_COLUMNS = ("company", "year", "metric_id", "pillar", "disclosed", "run_id")
+GROUP_COLUMNS = ("company", "year", "metric_id", "pillar")
+
+# Tokens that describe the document rather than the company (removed as whole words)
+_REPORT_WORDS = {
+    "brsr", "business", "responsibility", "sustainability", "annual", "integrated", "esg", "report", "reports",
+}
+_FISCAL_TOKEN = re.compile(r"^FY(\d{2})?$", re.IGNORECASE)
+_EDGE_CONNECTORS = {"and", "&", "of", "the", "for", "-", "–"}
+
+
+def infer_company_and_year(source_document: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Best-effort company / reporting year from a report file name,
+    e.g. 'Infosys BRSR 2024.pdf' -> ('Infosys', 2024), 'Acme_Annual_Report_2023-24.pdf' -> ('Acme', 2024),
+    'BRSR_Wipro_2023.pdf' / 'Wipro_BRSR_2023.pdf' -> ('Wipro', 2023).
+    """
+    if not source_document:
+        return None, None
+
+    stem = Path(source_document).stem.replace("_", " ")
+    year = None
+    years = re.findall(r"((?:19|20)\d{2})(?:\s*[-–]\s*(\d{2}|\d{4}))?", stem)
+    if years:
+        start, end = years[-1]
+        year = int(start) if not end else int(start[:4 - len(end)] + end)
+
+    stem = re.sub(r"(?:19|20)\d{2}(?:\s*[-–]\s*\d{2,4})?", " ", stem)
+    tokens = [
+        token for token in (t.strip("-–.,()") for t in stem.split())
+        if token and token.lower() not in _REPORT_WORDS and not _FISCAL_TOKEN.match(token)
+    ]
+    # Connectors left at the edges by removed words ('... Sustainability Report - Reliance')
+    while tokens and tokens[0].lower() in _EDGE_CONNECTORS:
+        tokens.pop(0)
+    while tokens and tokens[-1].lower() in _EDGE_CONNECTORS:
+        tokens.pop()
+    company = " ".join(tokens) or None
+    return company, year
+
+
+class PortfolioStore:
+    """
+    Persistent SQLite store of consolidated records across runs (one row per run and metric),
+    with run provenance, indexed on company / year / metric / pillar for cross-company queries.
+    Survives run-folder cleanup.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY,"
+                " company TEXT,"
+                " year INTEGER,"
+                " source_document TEXT,"
+                " extraction_model TEXT,"
+                " generated_at TEXT,"
+                " ingested_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS disclosures ("
+                " run_id TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,"
+                " metric_id TEXT NOT NULL,"
+                " company TEXT,"
+                " year INTEGER,"
+                " pillar TEXT,"
+                " summary TEXT,"
+                " key_facts TEXT,"
+                " page TEXT,"
+                " disclosed INTEGER NOT NULL,"
+                " PRIMARY KEY (run_id, metric_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_disc_metric ON disclosures (metric_id, year)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_disc_company ON disclosures (company, year)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_disc_pillar ON disclosures (pillar, year)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_company ON runs (company, year, ingested_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- WRITE ---
+
+    def ingest_run(self, run_metadata: Dict[str, Any], records: List[Dict[str, Any]], pillar_of) -> int:
+        """Replaces a run's rows with its consolidated records; returns the number of metrics stored."""
+        company, year = infer_company_and_year(run_metadata.get("source_document"))
+        company = run_metadata.get("company") or company
+        year = run_metadata.get("year") or year
+
+        rows = []
+        for rec in records:
+            summary = rec.get("summary") or "Not disclosed in the report."
+            rows.append((
+                run_metadata["run_id"],
+                rec["metric_id"],
+                company,
+                year,
+                pillar_of(rec["metric_id"]),
+                summary,
+                json.dumps(rec.get("key_facts") or [], ensure_ascii=False),
+                str(rec["page"]) if rec.get("page") else None,
+                int(summary != "Not disclosed in the report."),
+            ))
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM runs WHERE run_id = ?", (run_metadata["run_id"],))
+            conn.execute(
+                "INSERT INTO runs (run_id, company, year, source_document, extraction_model, generated_at, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_metadata["run_id"], company, year, run_metadata.get("source_document"),
+                    run_metadata.get("extraction_model"),
+                    str(run_metadata["generated_at"]) if run_metadata.get("generated_at") else None,
+                    time.time()
+                )
+            )
+            conn.executemany(
+                "INSERT INTO disclosures (run_id, metric_id, company, year, pillar, summary, key_facts, page, disclosed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+        logger.info(f"Portfolio: ingested {len(rows)} metrics for run {run_metadata['run_id']} ({company}, {year}).")
+        return len(rows)
+
+    # --- READ ---
+
+    @staticmethod
+    def _where(filters: Dict[str, Any], latest_only: bool) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for column in FILTER_COLUMNS:
+            value = filters.get(column)
+            if value is None:
+                continue
+            clauses.append(f"d.{column} = ?")
+            params.append(int(value) if column == "disclosed" else value)
+
+        if latest_only:
+            # Only the most recently ingested run per (company, year); runs whose company could
+            # not be inferred are never collapsed into each other
+            clauses.append(
+                "(d.company IS NULL OR d.run_id = (SELECT r2.run_id FROM runs r2 "
+                "WHERE r2.company = d.company AND r2.year IS d.year ORDER BY r2.ingested_at DESC LIMIT 1))"
+            )
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, filters: Dict[str, Any], latest_only: bool = True, limit: int = 500) -> List[Dict[str, Any]]:
+        """Matching metric rows with run provenance."""
+        where, params = self._where(filters, latest_only)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.run_id, d.company, d.year, d.metric_id, d.pillar, d.summary, d.key_facts, d.page, "
+                " d.disclosed, r.source_document, r.extraction_model, r.generated_at "
+                f"FROM disclosures d JOIN runs r ON r.run_id = d.run_id {where} "
+                "ORDER BY d.company, d.year, d.metric_id LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            item = dict(row)
+            item["key_facts"] = json.loads(item["key_facts"] or "[]")
+            item["disclosed"] = bool(item["disclosed"])
+            results.append(item)
+        return results
+
+    def aggregate(self, group_by: str, filters: Dict[str, Any], latest_only: bool = True) -> List[Dict[str, Any]]:
+        """Metric / disclosed counts and disclosure rate per `group_by` value."""
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {GROUP_COLUMNS}")
+
+        where, params = self._where(filters, latest_only)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT d.{group_by} AS value, COUNT(*) AS metrics, SUM(d.disclosed) AS disclosed, "
+                " COUNT(DISTINCT d.run_id) AS runs "
+                f"FROM disclosures d {where} GROUP BY d.{group_by} ORDER BY d.{group_by}",
+                params
+            ).fetchall()
+
+        return [
+            {
+                group_by: row["value"],
+                "runs": row["runs"],
+                "metrics": row["metrics"],
+                "disclosed": row["disclosed"],
+                "disclosure_rate": round(row["disclosed"] / row["metrics"], 4) if row["metrics"] else 0.0,
+            }
+            for row in rows
+        ]
+
+
+@lru_cache(maxsize=4)
+def _store_instance(db_path: str) -> PortfolioStore:
+    return PortfolioStore(Path(db_path))
+
+
+def get_portfolio_store(portfolio_cfg: Optional[Dict]) -> Optional[PortfolioStore]:
+    """Builds (once per process) the store described by a `portfolio` config block, if enabled."""
+    if not portfolio_cfg or not portfolio_cfg.get("enabled", False):
+        return None
+    return _store_instance(str(portfolio_cfg.get("path", "portfolio/portfolio.sqlite")))
@@ -0,0 +1,199 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from litellm import completion_cost, cost_per_token
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILENAME = "run_metrics.json"
+
+_COUNTERS = (
+    "llm_calls", "llm_cached_calls", "embedding_calls", "embedding_cached_calls",
+    "prompt_tokens", "completion_tokens", "embedding_tokens", "cost_usd", "fallbacks",
+)
+
+# --- DATA MODEL ---
+
+class RunMetrics:
+    """
+    Per-run instrumentation: wall time per stage plus LLM / embedding call counts,
+    tokens, estimated cost and degraded fallbacks, aggregated per stage and per question batch.
+    Calls are attributed through the active `metrics_scope` / `metrics_labels` context,
+    which follows asyncio tasks and `to_thread` workers.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.batches: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(table: Dict[str, Dict[str, float]], name: str) -> Dict[str, float]:
+        return table.setdefault(name, {k: 0 for k in _COUNTERS})
+
+    def add(self, stage: Optional[str], batch: Optional[str], **values: float):
+        """Adds counter values to the stage bucket and, when given, the batch bucket."""
+        with self._lock:
+            targets = [self._bucket(self.stages, stage or "unattributed")]
+            if batch:
+                targets.append(self._bucket(self.batches, batch))
+            for bucket in targets:
+                for key, value in values.items():
+                    bucket[key] = bucket.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a pipeline stage and attributes every call made inside it to that stage."""
+        started = time.perf_counter()
+        with metrics_labels(stage=name):
+            try:
+                yield
+            finally:
+                self.add(name, None, wall_seconds=round(time.perf_counter() - started, 3))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+            batches = {k: dict(v) for k, v in self.batches.items()}
+
+        totals = {k: 0 for k in (*_COUNTERS, "wall_seconds")}
+        for bucket in stages.values():
+            for key in totals:
+                totals[key] += bucket.get(key, 0)
+        totals["cost_usd"] = round(totals["cost_usd"], 6)
+
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "totals": totals,
+            "stages": stages,
+            "batches": batches,
+        }
+
+    def save(self, run_dir: Path, section: str, extra: Optional[Dict[str, Any]] = None) -> Path:
+        """
+        Writes this run's metrics under `section` (e.g. 'ingestion', 'report') of
+        `run_metrics.json` in the run dir, keeping the other sections.
+        """
+        path = Path(run_dir) / METRICS_FILENAME
+        try:
+            existing = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        except Exception:
+            existing = {}
+
+        existing[section] = {**self.to_dict(), **(extra or {})}
+        path.write_text(json.dumps(existing, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        logger.info(f"Run metrics ({section}) written to {path}: {existing[section]['totals']}")
+        return path
+
+
+# --- CONTEXT ---
+
+_ACTIVE_METRICS: ContextVar[Optional[RunMetrics]] = ContextVar("run_metrics", default=None)
+_LABELS: ContextVar[Tuple[Optional[str], Optional[str]]] = ContextVar("run_metrics_labels", default=(None, None))
+
+
+@contextmanager
+def metrics_scope(metrics: Optional[RunMetrics]):
+    """Records every instrumented call made inside this block into `metrics`."""
+    token = _ACTIVE_METRICS.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _ACTIVE_METRICS.reset(token)
+
+
+@contextmanager
+def metrics_labels(stage: Optional[str] = None, batch: Optional[str] = None):
+    """Overrides the stage and/or batch that calls in this block are attributed to."""
+    current_stage, current_batch = _LABELS.get()
+    token = _LABELS.set((stage or current_stage, batch or current_batch))
+    try:
+        yield
+    finally:
+        _LABELS.reset(token)
+
+
+def record_metric(**values: float):
+    """Adds arbitrary counters (e.g. busy seconds) under the current stage/batch labels."""
+    metrics = _ACTIVE_METRICS.get()
+    if metrics is not None:
+        metrics.add(*_LABELS.get(), **values)
+
+
+# --- CALL HOOKS ---
+
+def _usage(response, field: str) -> int:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0
+    value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+    return int(value or 0)
+
+
+def record_llm_call(model: str, response, cached: bool = False):
+    """Counts one chat completion with its token usage and estimated cost (cache hits cost nothing)."""
+    if _ACTIVE_METRICS.get() is None:
+        return
+    if cached:
+        record_metric(llm_cached_calls=1)
+        return
+
+    prompt_tokens = _usage(response, "prompt_tokens")
+    completion_tokens = _usage(response, "completion_tokens")
+    try:
+        cost = float(completion_cost(completion_response=response) or 0.0)
+    except Exception:
+        try:
+            # Streamed calls only carry a usage block (final chunk), priced per token
+            cost = float(sum(cost_per_token(
+                model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )))
+        except Exception:
+            cost = 0.0  # model missing from the price map
+
+    record_metric(
+        llm_calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_usd=cost
+    )
+
+
+def record_embedding_call(model: str, response=None, cached: bool = False):
+    """Counts one embeddings request with its token usage and estimated cost."""
+    if _ACTIVE_METRICS.get() is None:
+        return
+    if cached:
+        record_metric(embedding_cached_calls=1)
+        return
+
+    tokens = _usage(response, "prompt_tokens")
+    try:
+        cost = float(cost_per_token(model=model, prompt_tokens=tokens, completion_tokens=0)[0])
+    except Exception:
+        cost = 0.0
+
+    record_metric(embedding_calls=1, embedding_tokens=tokens, cost_usd=cost)
+
+
+def load_run_metrics(run_dir: Path) -> Optional[Dict[str, Any]]:
+    """Reads `run_metrics.json` from a run dir (None if the run has not written one yet)."""
+    path = Path(run_dir) / METRICS_FILENAME
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.warning(f"Could not read run metrics at {path}: {e}")
+        return None
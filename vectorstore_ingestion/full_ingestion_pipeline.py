@@ -10,6 +10,7 @@ from chromadb import PersistentClient
 from utils.logger import logging
 from utils.exception import CustomException
 from utils.read_yaml import read_yaml
+from utils.run_metrics import RunMetrics, metrics_scope, record_embedding_call
 
 # Component Imports
 from vectorstore_ingestion.report_data_extraction import ReportIntakePipeline
@@ -50,6 +51,7 @@ def create_embeddings_direct(chunks: List[Dict[str, Any]], db_path: Path, collec
                 model=embedding_model,
                 input=batch_texts
             )
+            record_embedding_call(embedding_model, response)
             
             # Extract and append vectors from this batch
             batch_vectors = [e.embedding for e in response.data]
@@ -74,7 +76,17 @@ def create_embeddings_direct(chunks: List[Dict[str, Any]], db_path: Path, collec
 def run_ingestion_pipeline(input_pdf_path: Path, config_path: Path, run_paths: Dict[str, Path]):
     """
     Data processing pipeline. Orchestration (folder creation) is handled by the caller (API).
+    Per-stage wall time and embedding usage are written to `run_metrics.json` in the run dir.
     """
+    run_dir = run_paths["db_path"].parent
+    metrics = RunMetrics(run_dir.name)
+    try:
+        with metrics_scope(metrics):
+            return _run_ingestion_stages(input_pdf_path, config_path, run_paths, metrics)
+    finally:
+        metrics.save(run_dir, "ingestion")
+
+def _run_ingestion_stages(input_pdf_path: Path, config_path: Path, run_paths: Dict[str, Path], metrics: RunMetrics):
     try:
         config = read_yaml(config_path)
         
@@ -88,13 +100,14 @@ def run_ingestion_pipeline(input_pdf_path: Path, config_path: Path, run_paths: D
         # 1. STAGE 1: Report Ingestion (PDF -> Text)
         params = config.processing_params
         pipeline = ReportIntakePipeline(hard_page_limit=params.hard_page_limit)
-        pipeline.run_report_ingestion(
-            file_path=str(input_pdf_path), 
-            output_txt=str(run_paths["formatted_txt"]),
-            start_page=1, 
-            batch_size=params.batch_size,
-            max_workers=params.max_workers
-        )
+        with metrics.stage("pdf_extraction"):
+            pipeline.run_report_ingestion(
+                file_path=str(input_pdf_path), 
+                output_txt=str(run_paths["formatted_txt"]),
+                start_page=1, 
+                batch_size=params.batch_size,
+                max_workers=params.max_workers
+            )
         logger.info("Stage 1 complete: Text extracted.")
 
         # 2. STAGE 2: Contextualized Chunking
@@ -102,7 +115,8 @@ def run_ingestion_pipeline(input_pdf_path: Path, config_path: Path, run_paths: D
             raise FileNotFoundError(f"Formatted text missing: {run_paths['formatted_txt']}")
 
         full_text = run_paths["formatted_txt"].read_text(encoding="utf-8")
-        chunks = chunk_document_final(full_text, input_pdf_path.name)
+        with metrics.stage("chunking"):
+            chunks = chunk_document_final(full_text, input_pdf_path.name)
         
         # Debug output for verification
         with run_paths["chunks_debug"].open("w", encoding="utf-8") as f:
@@ -112,12 +126,13 @@ def run_ingestion_pipeline(input_pdf_path: Path, config_path: Path, run_paths: D
 
         # 3. STAGE 3: Vectorstore Creation
         vs_cfg = config.vectorstore_params
-        create_embeddings_direct(
-            chunks=chunks,
-            db_path=run_paths["db_path"],
-            collection_name=vs_cfg.collection_name,
-            embedding_model=vs_cfg.embedding_model
-        )
+        with metrics.stage("embedding"):
+            create_embeddings_direct(
+                chunks=chunks,
+                db_path=run_paths["db_path"],
+                collection_name=vs_cfg.collection_name,
+                embedding_model=vs_cfg.embedding_model
+            )
 
         logger.info(f"--- PROCESSING SUCCESSFUL ---")
         return True